@@ -0,0 +1,76 @@
+"""
+Check that every scraper gives the same shows with lxml and html.parser.
+
+Runs the scrapers from cache.db only (nothing is fetched) with each parser
+and compares their output. Usage:
+
+    PYTHONPATH=. python3 scripts/check_parsers.py [festival ...]
+"""
+
+import importlib.util
+import json
+import os
+import sys
+from pathlib import Path
+
+import src.showlib as showlib
+
+PARSERS = ["html.parser", "lxml"]
+SRC = Path(__file__).parent.parent / "src"
+
+
+def run_scraper(festival):
+    """The shows a festival's scraper would save, as JSON"""
+    spec = importlib.util.spec_from_file_location(
+        f"{festival}.scrape", SRC / festival / "scrape.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    shows = []
+    def capture(get_shows, filename, festival_name=None, **kwargs):
+        shows.extend(get_shows())
+    scrape = showlib.scrape
+    showlib.scrape = capture
+    try:
+        module.main()
+    finally:
+        showlib.scrape = scrape
+    return json.dumps([show.to_dict() for show in shows], indent=2, ensure_ascii=False,
+                      sort_keys=True)
+
+
+def main():
+    # Only what's in the cache, and really parse every page
+    os.environ["HTTPCACHE_OFFLINE"] = "1"
+    os.environ["PARSE_CACHE"] = "0"
+
+    festivals = sys.argv[1:] or sorted(
+        path.parent.name for path in SRC.glob("*/scrape.py")
+    )
+    failed = False
+    for festival in festivals:
+        outputs = {}
+        try:
+            for parser in PARSERS:
+                os.environ["SOUP_PARSER"] = parser
+                outputs[parser] = run_scraper(festival)
+        except Exception as e:
+            print(f"{festival}: couldn't run ({type(e).__name__}: {e})")
+            continue
+        first, second = (outputs[parser] for parser in PARSERS)
+        if first == second:
+            print(f"{festival}: same output ({len(json.loads(first))} shows)")
+            continue
+        failed = True
+        print(f"{festival}: DIFFERENT output")
+        for line_a, line_b in zip(first.splitlines(), second.splitlines()):
+            if line_a != line_b:
+                print(f"  {PARSERS[0]}: {line_a.strip()}")
+                print(f"  {PARSERS[1]}: {line_b.strip()}")
+                break
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
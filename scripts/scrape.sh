@@ -1,11 +1,11 @@
-python3 src/mutek-2025/scrape.py
-python3 src/fantasia-2025/scrape.py
-python3 src/theatre-de-verdure-2025/scrape.py
-python3 src/shakespeare-2025/scrape.py
-python3 src/nuits-d-afrique-2025/scrape.py
-python3 src/fireworks-2025/scrape.py
-python3 src/haiti-en-folie-2025/scrape.py
-python3 src/presence-autochtone-2025/scrape.py
-python3 src/wild-pride-2025/scrape.py
-python3 src/italfest-2025/scrape.py
-python3 src/cinemania-2025/scrape.py
+# Every scraper appends its fetch stats here, reported at the end
+export HTTPCACHE_STATS=${HTTPCACHE_STATS:-cache-stats.jsonl}
+rm -f "$HTTPCACHE_STATS"
+# All the scrapers at once, see src/scrape.py. If one fails, still tidy up
+# the cache and report before failing the build. Festivals that kept their
+# last good shows.json (exit status 2) don't fail it.
+scrape_status=0
+python3 src/scrape.py || scrape_status=$?
+python3 src/cache.py evict
+python3 src/cache.py stats --json cache-stats.json
+[ "$scrape_status" -eq 0 ] || [ "$scrape_status" -eq 2 ]
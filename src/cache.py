@@ -1,71 +1,1326 @@
-import time
+import argparse
+import ast
+import asyncio
+import atexit
+import hashlib
+import json
 import os
+import queue
+import random
+import re
 import sqlite3
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from functools import cached_property, partial
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
 import requests
+from requests.adapters import HTTPAdapter
 
+from src import fetchstats
+from src.ratelimit import default_breakers, default_limiter, parse_retry_after
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Maximum number of queued writes committed together in one transaction
+WRITE_BATCH_SIZE = 500
+
+# Keep-alive connections kept open per host, should match the number of
+# threads a scraper fetches with
+DEFAULT_POOL_SIZE = 10
+
+# Columns of the responses table, in CachedResponse.to_row() order
+RESPONSE_COLUMNS = {
+    "url": "TEXT PRIMARY KEY",
+    "body": "BLOB NOT NULL",
+    "content_type": "TEXT",
+    "charset": "TEXT",
+    "fetched_at": "REAL NOT NULL",
+    "etag": "TEXT",
+    "last_modified": "TEXT",
+    "host": "TEXT",
+    "size": "INTEGER",
+    "last_accessed": "REAL",
+    "status": "INTEGER",
+    "headers": "TEXT",
+}
+
+# Response headers kept in the cache (as JSON), for pagination
+STORED_HEADERS = ("link", "x-wp-total", "x-wp-totalpages")
+
+# Pages that don't exist are cached too, but only for this many seconds
+NEGATIVE_STATUSES = (404, 410)
+NEGATIVE_TTL = 3600
+
+# Failures worth trying again, with jittered exponential backoff
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_RETRIES = 2
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 10
+
+# Maximum number of parameters in one SQLite query
+SQL_BATCH_SIZE = 500
+
+# Don't queue a write for every cache hit: last_accessed only needs to be
+# roughly right for LRU eviction
+ACCESS_RESOLUTION = 3600
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+INSERT_RESPONSE_SQL = "INSERT OR REPLACE INTO responses ({}) VALUES ({})".format(
+    ", ".join(RESPONSE_COLUMNS), ", ".join("?" * len(RESPONSE_COLUMNS))
+)
+
+# Request headers that can change the response, so they're part of the cache
+# key of non-GET requests (Referer, User-Agent etc. aren't)
+KEY_HEADERS = ("accept", "accept-language", "authorization", "content-type")
+
+CHARSET_RE = re.compile(r"charset=[\"']?([\w.:-]+)", re.I)
+
+
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+
+def parse_size(text):
+    """Parse a size like 500M or 2G into bytes"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*", text, re.I)
+    if not match:
+        raise ValueError(f"invalid size: {text!r}")
+    return int(float(match[1]) * SIZE_UNITS[match[2].upper()])
+
+
+def parse_duration(text):
+    """Parse a duration like 30d or 12h into seconds"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", text)
+    if not match:
+        raise ValueError(f"invalid duration: {text!r}")
+    return float(match[1]) * DURATION_UNITS[match[2]]
+
+
+def seconds_from_env(name):
+    """A number of seconds from an environment variable, or None"""
+    value = os.environ.get(name)
+    if value:
+        return parse_duration(value)
+    return None
+
+
+class FetchError(requests.RequestException):
+    """A request we gave up on without (or before) getting a response"""
+
+
+class CachedHTTPError(FetchError, requests.HTTPError):
+    """The cache remembers that this URL was a 404 or 410"""
+
+
+class CircuitOpenError(FetchError):
+    """The host failed too many times in a row, so we're not trying it"""
+
+
+class DeadlineExceeded(FetchError):
+    """The scraper's time budget is spent"""
+
+
+class RetryAfterTooLong(FetchError):
+    """The server asked us to wait longer than RETRY_MAX_DELAY before retrying"""
+
+
+class NotCached(FetchError):
+    """Offline mode, and the response isn't in the cache"""
+
+
+class CacheWriteError(Exception):
+    """Some writes to cache.db failed, see _Store.flush"""
+
+
+def festival_hosts(festival):
+    """
+    The HOSTS that src/<festival>/scrape.py declares, without importing it.
+    Every scraper has a module-level `HOSTS = [...]` literal listing the
+    sites it fetches from (subdomains included), which `export` and `stats`
+    use to find its responses.
+    """
+    path = os.path.join(PROJECT_ROOT, "src", festival, "scrape.py")
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == "HOSTS" for target in node.targets
+        ):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"{path} doesn't declare HOSTS")
+
+
+def stored_by_festival(rows):
+    """
+    Sum size_by_host() rows up per festival: {festival: (responses, bytes)}.
+    Festivals that don't declare HOSTS are left out, with a warning.
+    """
+    stored = {}
+    src = os.path.join(PROJECT_ROOT, "src")
+    for festival in sorted(os.listdir(src)):
+        if not os.path.exists(os.path.join(src, festival, "scrape.py")):
+            continue
+        try:
+            hosts = festival_hosts(festival)
+        except ValueError as e:
+            print(f"warning: {e}, leaving {festival} out of the sizes", file=sys.stderr)
+            continue
+        matching = [
+            (count, size) for host, count, size in rows
+            if any(host == h or host.endswith("." + h) for h in hosts)
+        ]
+        stored[festival] = (sum(c for c, _ in matching), sum(s for _, s in matching))
+    return stored
+
+
+def stored_headers(response):
+    """The STORED_HEADERS of a requests.Response, with lowercase names"""
+    return {
+        name: response.headers[name] for name in STORED_HEADERS if name in response.headers
+    }
+
+
+def with_query(url, **params):
+    """url with some query parameters added or replaced"""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    query.update({name: str(value) for name, value in params.items()})
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def canonical_json(obj):
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def parse_charset(content_type):
+    """Return the charset declared in a Content-Type header, if any"""
+    match = CHARSET_RE.search(content_type or "")
+    if match:
+        return match[1].lower()
+    return None
+
+
+class CachedResponse:
+    """
+    A response body as stored in the cache.
+
+    The body is kept zlib-compressed until `content` is first used, and
+    `text` decodes it once, with the charset the server declared.
+    `headers` only has the STORED_HEADERS, with lowercase names (None for
+    responses cached before headers were kept).
+    """
+
+    def __init__(self, url, content=None, content_type=None, charset=None,
+                 fetched_at=None, etag=None, last_modified=None, compressed=None,
+                 last_accessed=None, status=200, headers=None):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.content_type = content_type
+        self.charset = charset
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.etag = etag
+        self.last_modified = last_modified
+        self.last_accessed = last_accessed or self.fetched_at
+        if content is not None:
+            self.content = content
+        self._compressed = compressed
+
+    @cached_property
+    def content(self):
+        return zlib.decompress(self._compressed)
+
+    @cached_property
+    def compressed(self):
+        if self._compressed is None:
+            self._compressed = zlib.compress(self.content)
+        return self._compressed
+
+    @cached_property
+    def text(self):
+        if self.charset:
+            try:
+                return self.content.decode(self.charset, errors="replace")
+            except LookupError:
+                pass
+        # No (usable) charset declared: most sites are UTF-8 anyway
+        try:
+            return self.content.decode("utf-8")
+        except UnicodeDecodeError:
+            return self.content.decode("windows-1252", errors="replace")
+
+    @classmethod
+    def from_row(cls, row):
+        fields = dict(zip(RESPONSE_COLUMNS, row))
+        return cls(
+            fields["url"],
+            None,
+            fields["content_type"],
+            fields["charset"],
+            fields["fetched_at"],
+            fields["etag"],
+            fields["last_modified"],
+            compressed=fields["body"],
+            last_accessed=fields["last_accessed"],
+            status=fields["status"] or 200,
+            headers=json.loads(fields["headers"]) if fields["headers"] is not None else None,
+        )
+
+    @classmethod
+    def from_http(cls, url, response):
+        content_type = response.headers.get("Content-Type")
+        return cls(
+            url,
+            response.content,
+            content_type,
+            parse_charset(content_type),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            status=response.status_code,
+            headers=stored_headers(response),
+        )
+
+    def json(self):
+        return json.loads(self.content)
+
+    def to_row(self):
+        return (self.url, self.compressed, self.content_type, self.charset,
+                self.fetched_at, self.etag, self.last_modified, host_of(self.url),
+                len(self.compressed), self.last_accessed, self.status,
+                json.dumps(self.headers) if self.headers is not None else None)
+
+    def is_stale(self, ttl):
+        if self.status in NEGATIVE_STATUSES:
+            ttl = NEGATIVE_TTL if ttl is None else min(ttl, NEGATIVE_TTL)
+        return ttl is not None and time.time() - self.fetched_at > ttl
+
+    def raise_for_status(self):
+        if self.status in NEGATIVE_STATUSES:
+            raise CachedHTTPError(f"{self.status} Client Error for url: {self.url}")
+        return self
+
+    def validators(self):
+        """Headers that make a refetch conditional on the page having changed"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class Request:
+    """
+    An HTTP request and the key its response is cached under.
+
+    GET requests are keyed by their URL. Other requests are keyed by a hash
+    of the method, URL, KEY_HEADERS and body, with JSON bodies serialized
+    canonically so that equal queries share a cache entry.
+    """
+
+    def __init__(self, url, method="GET", headers=None, data=None, json=None):
+        self.url = url
+        self.method = method.upper()
+        self.headers = dict(headers or {})
+        if json is not None:
+            data = canonical_json(json)
+            if not any(name.lower() == "content-type" for name in self.headers):
+                self.headers["Content-Type"] = "application/json"
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.data = data
+
+    @cached_property
+    def key(self):
+        if self.method == "GET" and not self.data:
+            return self.url
+        digest = hashlib.sha256()
+        digest.update(f"{self.method} {self.url}\n".encode())
+        for name, value in sorted((name.lower(), value) for name, value in self.headers.items()):
+            if name in KEY_HEADERS:
+                digest.update(f"{name}: {value}\n".encode())
+        digest.update(b"\n" + (self.data or b""))
+        return f"{self.url}#{self.method}:{digest.hexdigest()}"
+
+
+def legacy_body(content):
+    """
+    Recover the response bytes from a row of the old `cache` table.
+
+    Those rows hold requests' `response.text`, which is UTF-8 decoded as
+    latin-1 whenever the server didn't send a charset.
+    """
+    try:
+        raw = content.encode("latin-1")
+        raw.decode("utf-8")
+        return raw
+    except UnicodeError:
+        return content.encode("utf-8")
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time: callers that arrive while a
+    call for their key is in flight wait for it and share its result.
+    `run` returns (result, shared), shared being True for those callers.
+    """
 
-class HTTPCache:
     def __init__(self):
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(current_dir)
-        db_path = os.path.join(project_root, "cache.db")
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class _Store:
+    """
+    SQLite access shared by every HTTPCache in the process.
+
+    Each thread gets its own long-lived read connection, and all writes go
+    through one background writer thread that commits them in batches.
+    """
+
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, db_path):
+        with cls._stores_lock:
+            store = cls._stores.get(db_path)
+            if store is None or store.closed:
+                store = cls(db_path)
+                cls._stores[db_path] = store
+            return store
+
+    def __init__(self, db_path):
         self.db_path = db_path
+        self.closed = False
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        # Writes that are queued but not committed yet, so reads see them
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        # sqlite errors from the writer thread, until flush() raises them
+        self._write_errors = []
+        # Requests being fetched right now, by cache key
+        self.inflight = SingleFlight()
+
         self._init_db()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="httpcache-writer", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
 
     def _init_db(self):
-        """Create cache table if it doesn't exist"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS cache (
-                    url TEXT PRIMARY KEY,
-                    content TEXT NOT NULL,
-                    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        """Create the responses table, migrating the old `cache` table"""
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = ", ".join(f"{name} {kind}" for name, kind in RESPONSE_COLUMNS.items())
+            conn.execute(f"CREATE TABLE IF NOT EXISTS responses ({columns})")
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(responses)")}
+            for name, kind in RESPONSE_COLUMNS.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE responses ADD COLUMN {name} {kind}")
+            if "host" not in existing:
+                conn.executemany(
+                    "UPDATE responses SET host = ?, size = length(body), "
+                    "last_accessed = fetched_at WHERE url = ?",
+                    [(host_of(url), url) for (url,) in conn.execute("SELECT url FROM responses")],
                 )
-            """
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_accessed)")
+            # When each festival was last synced, see showlib.scrape
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_marks (festival TEXT PRIMARY KEY, mark TEXT NOT NULL)"
             )
+            # Memoized parser results, see showlib.memoize. They're evicted
+            # along with the responses, by last_accessed.
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS parsed (parser TEXT NOT NULL, version INTEGER NOT NULL, "
+                "digest TEXT NOT NULL, result TEXT NOT NULL, last_accessed REAL, "
+                "PRIMARY KEY (parser, version, digest))"
+            )
+            if "last_accessed" not in {row[1] for row in conn.execute("PRAGMA table_info(parsed)")}:
+                conn.execute("ALTER TABLE parsed ADD COLUMN last_accessed REAL")
+                conn.execute("UPDATE parsed SET last_accessed = ?", (time.time(),))
+            conn.execute("CREATE INDEX IF NOT EXISTS parsed_lru ON parsed (last_accessed)")
+            legacy = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'cache'"
+            ).fetchone()
+            if legacy:
+                rows = conn.execute(
+                    "SELECT url, content, CAST(strftime('%s', fetched_at) AS REAL) FROM cache"
+                )
+                conn.executemany(
+                    INSERT_RESPONSE_SQL.replace("OR REPLACE", "OR IGNORE"),
+                    (
+                        CachedResponse(url, legacy_body(content), None, "utf-8",
+                                       fetched_at or time.time()).to_row()
+                        for url, content, fetched_at in rows
+                    ),
+                )
+                conn.execute("DROP TABLE cache")
             conn.commit()
 
+    def reader(self):
+        """Return this thread's read connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
     def get(self, url):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                """
-                SELECT content, fetched_at FROM cache 
-                WHERE url = ?
-                ORDER BY fetched_at DESC
-                LIMIT 1
-            """,
-                (url,),
+        with self._pending_lock:
+            if url in self._pending:
+                return self._pending[url]
+
+        columns = ", ".join(RESPONSE_COLUMNS)
+        row = (
+            self.reader()
+            .execute(f"SELECT {columns} FROM responses WHERE url = ?", (url,))
+            .fetchone()
+        )
+        if row:
+            return self._accessed(CachedResponse.from_row(row))
+        return None
+
+    def get_many(self, urls):
+        """Look up many urls at once, returns {url: CachedResponse} for the hits"""
+        found = {}
+        missing = []
+        with self._pending_lock:
+            for url in urls:
+                if url in self._pending:
+                    found[url] = self._pending[url]
+                else:
+                    missing.append(url)
+
+        columns = ", ".join(RESPONSE_COLUMNS)
+        for i in range(0, len(missing), SQL_BATCH_SIZE):
+            chunk = missing[i:i + SQL_BATCH_SIZE]
+            rows = self.reader().execute(
+                f"SELECT {columns} FROM responses WHERE url IN ({', '.join('?' * len(chunk))})",
+                chunk,
             )
-            row = cursor.fetchone()
+            for row in rows:
+                response = self._accessed(CachedResponse.from_row(row))
+                found[response.url] = response
+        return found
 
-            if row:
-                return row[0]
-            return None
+    def _accessed(self, response):
+        now = time.time()
+        if now - response.last_accessed > ACCESS_RESOLUTION:
+            response.last_accessed = now
+            self._write("UPDATE responses SET last_accessed = ? WHERE url = ?",
+                        (now, response.url))
+        return response
 
-    def put(self, url, content):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
+    def _write(self, sql, params=None, response=None):
+        if self.closed:
+            raise RuntimeError(f"cache {self.db_path} is closed")
+        self._queue.put((sql, params, response))
+
+    def put(self, response):
+        with self._pending_lock:
+            self._pending[response.url] = response
+        self._write(INSERT_RESPONSE_SQL, response=response)
+
+    def touch(self, url, fetched_at=None):
+        """Mark a cached response as fresh again, without rewriting its body"""
+        fetched_at = fetched_at or time.time()
+        with self._pending_lock:
+            if url in self._pending:
+                self._pending[url].fetched_at = fetched_at
+        self._write("UPDATE responses SET fetched_at = ? WHERE url = ?", (fetched_at, url))
+
+    def _write_loop(self):
+        conn = self._connect()
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            writes = [item for item in batch if item is not None]
+            stop = len(writes) < len(batch)
+            try:
+                self._commit(conn, writes)
+            except sqlite3.Error:
+                # Don't lose the whole batch because of one bad write
+                for write in writes:
+                    try:
+                        self._commit(conn, [write])
+                    except sqlite3.Error as e:
+                        with self._pending_lock:
+                            self._write_errors.append(e)
+            finally:
+                with self._pending_lock:
+                    for _, _, response in writes:
+                        if response is not None and self._pending.get(response.url) is response:
+                            del self._pending[response.url]
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def _commit(self, conn, writes):
+        with conn:
+            for sql, params, response in writes:
+                if params is None:
+                    # Compressing here keeps zlib off the fetching threads
+                    params = response.to_row()
+                conn.execute(sql, params)
+
+    def flush(self):
+        """
+        Block until every queued write has been committed. Raises
+        CacheWriteError if some of them failed since the last flush (from
+        any thread, the store is shared).
+        """
+        self._queue.join()
+        with self._pending_lock:
+            errors, self._write_errors = self._write_errors, []
+        if errors:
+            raise CacheWriteError(
+                f"{len(errors)} writes to {self.db_path} failed, the first one: {errors[0]}"
+            )
+
+    def evict(self, max_bytes=None, max_age=None, max_ages=None):
+        """
+        Delete responses and parse results that weren't used for max_age
+        seconds (max_ages[host] only applies to that host's responses), then
+        the least recently used ones until both together take at most
+        max_bytes. Returns how many (responses, parse results) went.
+        """
+        self.flush()
+        now = time.time()
+        responses = parsed = 0
+        with self._connect() as conn:
+            for host, age in (max_ages or {}).items():
+                responses += conn.execute(
+                    "DELETE FROM responses WHERE host = ? AND last_accessed < ?",
+                    (host.lower(), now - age),
+                ).rowcount
+            if max_age is not None:
+                responses += conn.execute(
+                    "DELETE FROM responses WHERE last_accessed < ?",
+                    (now - max_age,),
+                ).rowcount
+                parsed += conn.execute(
+                    "DELETE FROM parsed WHERE last_accessed < ?",
+                    (now - max_age,),
+                ).rowcount
+            if max_bytes is not None:
+                # Rank both tables together first: deleting from one changes
+                # the running sizes of the other
+                conn.execute(
+                    """
+                    CREATE TEMP TABLE evicted AS
+                    SELECT kind, id FROM (
+                        SELECT kind, id, SUM(size) OVER (
+                            ORDER BY last_accessed DESC, kind, id
+                        ) AS running_size
+                        FROM (
+                            SELECT 'response' AS kind, url AS id, size, last_accessed
+                            FROM responses
+                            UNION ALL
+                            SELECT 'parsed', rowid, length(result), last_accessed
+                            FROM parsed
+                        )
+                    )
+                    WHERE running_size > ?
+                """,
+                    (max_bytes,),
+                )
+                responses += conn.execute(
+                    "DELETE FROM responses WHERE url IN "
+                    "(SELECT id FROM evicted WHERE kind = 'response')"
+                ).rowcount
+                parsed += conn.execute(
+                    "DELETE FROM parsed WHERE rowid IN "
+                    "(SELECT id FROM evicted WHERE kind = 'parsed')"
+                ).rowcount
+                conn.execute("DROP TABLE evicted")
+        return responses, parsed
+
+    def compact(self):
+        """Reclaim the space left behind by replaced and evicted rows"""
+        self.flush()
+        conn = self._connect()
+        try:
+            conn.isolation_level = None
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+
+    def export_snapshot(self, path, hosts):
+        """
+        Copy the responses for hosts (and their subdomains) into a new
+        snapshot database at path. Returns the number of responses copied.
+        """
+        self.flush()
+        if os.path.exists(path):
+            os.remove(path)
+        match = " OR ".join(["host = ? OR host LIKE ?"] * len(hosts))
+        params = [param for host in hosts for param in (host.lower(), "%." + host.lower())]
+        columns = ", ".join(RESPONSE_COLUMNS)
+        definitions = ", ".join(f"{name} {kind}" for name, kind in RESPONSE_COLUMNS.items())
+
+        conn = self._connect()
+        try:
+            conn.execute("ATTACH DATABASE ? AS snapshot", (path,))
+            with conn:
+                conn.execute(f"CREATE TABLE snapshot.responses ({definitions})")
+                count = conn.execute(
+                    f"INSERT INTO snapshot.responses ({columns}) "
+                    f"SELECT {columns} FROM responses WHERE {match}",
+                    params,
+                ).rowcount
+            conn.execute("DETACH DATABASE snapshot")
+        finally:
+            conn.close()
+
+        # The snapshot is written once and then copied around, so make it small
+        conn = sqlite3.connect(path, isolation_level=None)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        return count
+
+    def import_snapshot(self, path):
+        """
+        Bulk insert a snapshot's responses, keeping whichever copy of a
+        response is newer. Returns the number of responses inserted or updated.
+        """
+        self.flush()
+        conn = self._connect()
+        try:
+            conn.execute("ATTACH DATABASE ? AS snapshot", (path,))
+            # Older snapshots can be missing the newer columns
+            existing = {row[1] for row in conn.execute("PRAGMA snapshot.table_info(responses)")}
+            names = [name for name in RESPONSE_COLUMNS if name in existing]
+            columns = ", ".join(names)
+            updates = ", ".join(f"{name} = excluded.{name}" for name in names if name != "url")
+            with conn:
+                count = conn.execute(
+                    f"""
+                    INSERT INTO responses ({columns})
+                    SELECT {columns} FROM snapshot.responses WHERE true  -- needed before ON CONFLICT
+                    ON CONFLICT (url) DO UPDATE SET {updates}
+                    WHERE excluded.fetched_at > responses.fetched_at
                 """
-                INSERT OR REPLACE INTO cache (url, content, fetched_at)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            """,
-                (url, content),
+                ).rowcount
+            conn.execute("DETACH DATABASE snapshot")
+        finally:
+            conn.close()
+        return count
+
+    def sync_mark(self, festival):
+        row = self.reader().execute(
+            "SELECT mark FROM sync_marks WHERE festival = ?", (festival,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_sync_mark(self, festival, mark):
+        self._write("INSERT OR REPLACE INTO sync_marks VALUES (?, ?)", (festival, mark))
+
+    def parsed(self, parser, version, digests):
+        now = time.time()
+        found = {}
+        for i in range(0, len(digests), SQL_BATCH_SIZE):
+            chunk = digests[i:i + SQL_BATCH_SIZE]
+            rows = self.reader().execute(
+                "SELECT digest, result, last_accessed FROM parsed WHERE parser = ? "
+                f"AND version = ? AND digest IN ({', '.join('?' * len(chunk))})",
+                (parser, version, *chunk),
             )
-            conn.commit()
+            for digest, result, last_accessed in rows:
+                found[digest] = result
+                if now - (last_accessed or 0) > ACCESS_RESOLUTION:
+                    self._write("UPDATE parsed SET last_accessed = ? WHERE parser = ? "
+                                "AND version = ? AND digest = ?", (now, parser, version, digest))
+        return found
+
+    def put_parsed(self, parser, version, digest, result):
+        self._write("INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?)",
+                    (parser, version, digest, result, time.time()))
+
+    def drop_parsed(self, parser, keep_version):
+        self._write("DELETE FROM parsed WHERE parser = ? AND version != ?", (parser, keep_version))
+
+    def size_by_host(self):
+        return self.reader().execute(
+            "SELECT host, COUNT(*), SUM(size) FROM responses GROUP BY host ORDER BY SUM(size) DESC"
+        ).fetchall()
+
+    def parsed_size(self):
+        count, size = self.reader().execute(
+            "SELECT COUNT(*), SUM(length(result)) FROM parsed"
+        ).fetchone()
+        return count, size or 0
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(None)
+        self._writer.join()
+        if self._write_errors:
+            # at exit, nobody is left to flush() and see them
+            print(f"HTTPCache: {len(self._write_errors)} writes to {self.db_path} failed, "
+                  f"the first one: {self._write_errors[0]}", file=sys.stderr)
+
+
+class HTTPCache:
+    """
+    Cache of HTTP responses in cache.db.
+
+    `ttl` is how many seconds a response stays fresh (None: forever, the
+    default unless $HTTPCACHE_TTL is set), `ttls` overrides it per host.
+    Stale responses are revalidated with If-None-Match / If-Modified-Since.
+
+    `max_bytes`, `max_age` and `max_ages` (per host) are the cache budget
+    that `evict()` enforces, see _Store.evict.
+
+    `pool_size` is both the number of keep-alive connections per host and
+    how many requests fetch_many sends to one host at once; `host_limits`
+    overrides it for specific hosts.
+
+    Requests are rate limited per host by a token bucket shared with the
+    other caches in the process; `rate_limits` maps hosts to
+    (requests per second, burst).
+
+    Transient failures are retried `retries` times, and a host that keeps
+    failing gets its circuit opened. `deadline` is the number of seconds
+    this cache may spend on the network (default: $HTTPCACHE_DEADLINE),
+    after which cache misses raise DeadlineExceeded. 404s and 410s are
+    cached for NEGATIVE_TTL seconds.
+
+    With `offline` (or $HTTPCACHE_OFFLINE=1), everything is served from the
+    cache however old it is, and misses raise NotCached.
+
+    Every lookup and fetch is recorded in `stats` (a FetchStats, shared
+    with the other caches in the process by default).
+    """
+
+    def __init__(self, db_path=None, pool_size=DEFAULT_POOL_SIZE, ttl=None, ttls=None,
+                 max_bytes=None, max_age=None, max_ages=None, host_limits=None,
+                 rate_limits=None, limiter=None, retries=DEFAULT_RETRIES, deadline=None,
+                 breakers=None, offline=None, stats=None):
+        if db_path is None:
+            db_path = os.path.join(PROJECT_ROOT, "cache.db")
+        self.db_path = db_path
+        if offline is None:
+            offline = os.environ.get("HTTPCACHE_OFFLINE", "") not in ("", "0")
+        self.offline = offline
+        self.pool_size = pool_size
+        self.ttl = ttl if ttl is not None else seconds_from_env("HTTPCACHE_TTL")
+        self.ttls = {host.lower(): seconds for host, seconds in (ttls or {}).items()}
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_ages = max_ages or {}
+        self.host_limits = {host.lower(): limit for host, limit in (host_limits or {}).items()}
+        self.limiter = limiter or default_limiter
+        for host, (rate, burst) in (rate_limits or {}).items():
+            self.limiter.configure(host, rate, burst)
+        self.breakers = breakers or default_breakers
+        self.stats = stats or fetchstats.default_stats
+        self.retries = retries
+        if deadline is None:
+            deadline = seconds_from_env("HTTPCACHE_DEADLINE")
+        self.deadline_at = time.monotonic() + deadline if deadline is not None else None
+        self._store = _Store.open(db_path)
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    def session(self, url):
+        """Return the keep-alive session for url's host"""
+        host = host_of(url)
+        with self._sessions_lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.host_limit(host))
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+            return session
+
+    def host_limit(self, host):
+        """How many requests to send to host at the same time"""
+        return self.host_limits.get(host, self.pool_size)
+
+    def get(self, url):
+        response = self.get_response(url)
+        if response is not None:
+            self.stats.hit(response, host_of(url))
+            return response.text
+        self.stats.record(url, host_of(url), False)
+        return None
+
+    def get_response(self, url):
+        return self._store.get(url)
+
+    def ttl_for(self, url, ttl=None):
+        """TTL for url: the per-call ttl, else the host's, else the default"""
+        if ttl is not None:
+            return ttl
+        return self.ttls.get(host_of(url), self.ttl)
+
+    def is_fresh(self, response, url, ttl=None):
+        """Whether a cached response (or None) can be used as is"""
+        if response is None:
+            return False
+        return self.offline or not response.is_stale(self.ttl_for(url, ttl))
+
+    def put(self, url, content, content_type=None, charset=None):
+        if isinstance(content, str):
+            charset = charset or "utf-8"
+            content = content.encode(charset)
+        elif charset is None:
+            charset = parse_charset(content_type)
+        self._store.put(CachedResponse(url, content, content_type, charset))
+
+    def flush(self):
+        """Wait until all pending writes are in cache.db"""
+        self._store.flush()
+
+    def evict(self):
+        """Enforce the cache budget, returns how many (responses, parse results) went"""
+        return self._store.evict(self.max_bytes, self.max_age, self.max_ages)
+
+    def compact(self):
+        self._store.compact()
+
+    def export_snapshot(self, path, hosts):
+        return self._store.export_snapshot(path, hosts)
 
-    def fetch(self, url, headers=None, timeout=1):
-        # check catch then fetch if not in cache
-        cached = self.get(url)
-        if cached:
+    def import_snapshot(self, path):
+        return self._store.import_snapshot(path)
+
+    def sync_mark(self, festival):
+        """When `festival` was last synced (an aware datetime), or None"""
+        mark = self._store.sync_mark(festival)
+        return datetime.fromisoformat(mark) if mark else None
+
+    def set_sync_mark(self, festival, when):
+        self._store.set_sync_mark(festival, when.isoformat())
+
+    def parsed(self, parser, version, digests):
+        """{digest: result JSON} for the digests `parser` already parsed"""
+        return self._store.parsed(parser, version, list(digests))
+
+    def put_parsed(self, parser, version, digest, result):
+        self._store.put_parsed(parser, version, digest, result)
+
+    def drop_parsed(self, parser, keep_version):
+        """Forget what older versions of `parser` returned"""
+        self._store.drop_parsed(parser, keep_version)
+
+    def size_by_host(self):
+        """(host, responses, compressed bytes) rows, biggest host first"""
+        return self._store.size_by_host()
+
+    def parsed_size(self):
+        """(memoized parse results, bytes), see showlib.memoize"""
+        return self._store.parsed_size()
+
+    def close(self):
+        self.flush()
+        if self.max_bytes is not None or self.max_age is not None or self.max_ages:
+            self.evict()
+        with self._sessions_lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def fetch_request(self, request, timeout=1, ttl=None):
+        """Send a Request (or get its response from the cache)"""
+        return self._fetch(request, self.get_response(request.key), timeout, ttl).raise_for_status()
+
+    def time_left(self):
+        """Seconds left before the deadline (None if there isn't one)"""
+        if self.deadline_at is None:
+            return None
+        left = self.deadline_at - time.monotonic()
+        if left <= 0:
+            raise DeadlineExceeded("out of time for this scrape")
+        return left
+
+    def _sleep_before_retry(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, RETRY_MAX_DELAY))
+        left = self.time_left()
+        if left is not None and delay >= left:
+            raise DeadlineExceeded("out of time for this scrape")
+        time.sleep(delay)
+
+    def _fetch(self, request, cached, timeout, ttl, rate_limited=False):
+        # use the cached response unless it's missing or stale
+        host = host_of(request.url)
+        if self.is_fresh(cached, request.url, ttl):
+            self.stats.hit(cached, host)
+            return cached
+        if self.offline:
+            self.stats.record(request.url, host, False, NotCached.__name__)
+            raise NotCached(f"{request.url} isn't in the cache (offline mode)")
+
+        response, shared = self._store.inflight.run(
+            request.key, partial(self._fetch_network, request, cached, timeout, ttl, rate_limited)
+        )
+        if shared:
+            # another caller did the fetch for us
+            self.stats.hit(response, host)
+        return response
+
+    def _fetch_network(self, request, cached, timeout, ttl, rate_limited):
+        host = host_of(request.url)
+        # Another thread may have fetched it between our lookup and now
+        latest = self._store.get(request.key)
+        if self.is_fresh(latest, request.url, ttl):
+            self.stats.hit(latest, host)
+            return latest
+        cached = latest or cached
+
+        headers = dict(request.headers)
+        if cached is not None:
+            headers.update(cached.validators())
+
+        started = time.monotonic()
+        try:
+            response = self._send(request, headers, timeout, rate_limited)
+        except Exception as e:
+            self.stats.record(request.url, host, False, type(e).__name__,
+                              seconds=time.monotonic() - started)
+            raise
+        self.stats.record(request.url, host, False, response.status_code, len(response.content),
+                          time.monotonic() - started)
+
+        if cached is not None and response.status_code == 304:
+            headers = stored_headers(response)
+            if cached.headers is not None and headers.items() <= cached.headers.items():
+                self._store.touch(request.key)
+                return cached
+            # Same body, but with headers we didn't store yet
+            cached.headers = {**(cached.headers or {}), **headers}
+            cached.fetched_at = time.time()
+            self._store.put(cached)
             return cached
 
-        response = requests.get(url, headers=headers or {}, timeout=timeout)
-        # Rate limit
-        time.sleep(0.1)
-        response.raise_for_status()
+        if response.status_code not in NEGATIVE_STATUSES:
+            response.raise_for_status()
+        cached = CachedResponse.from_http(request.key, response)
+        self._store.put(cached)
+
+        return cached
+
+    def _send(self, request, headers, timeout, rate_limited):
+        """Send a request, with retries, backoff and the circuit breaker"""
+        host = host_of(request.url)
+        for attempt in range(self.retries + 1):
+            left = self.time_left()
+            if not self.breakers.allow(host):
+                raise CircuitOpenError(f"{host} keeps failing, not fetching {request.url}")
+            if attempt or not rate_limited:
+                self.limiter.acquire(host)
+
+            try:
+                response = self.session(request.url).request(
+                    request.method, request.url, headers=headers, data=request.data,
+                    timeout=timeout if left is None else min(timeout, left),
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                self.breakers.failure(host)
+                if attempt == self.retries:
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+
+            if response.status_code not in RETRY_STATUSES:
+                self.limiter.recover(host)
+                self.breakers.success(host)
+                break
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status_code in (429, 503):
+                self.limiter.backoff(host, retry_after)
+            self.breakers.failure(host)
+            if attempt == self.retries:
+                break
+            if retry_after is not None and retry_after > RETRY_MAX_DELAY:
+                raise RetryAfterTooLong(
+                    f"{host} asked us to wait {retry_after:.0f}s before retrying {request.url}"
+                )
+            self._sleep_before_retry(attempt, retry_after)
+        return response
+
+    def fetch_response(self, url, headers=None, timeout=1, ttl=None):
+        return self.fetch_request(Request(url, headers=headers), timeout=timeout, ttl=ttl)
+
+    def fetch(self, url, headers=None, timeout=1, ttl=None):
+        """Fetch url (or get it from the cache) and return the decoded text"""
+        return self.fetch_response(url, headers=headers, timeout=timeout, ttl=ttl).text
+
+    def post(self, url, data=None, json=None, headers=None, timeout=1, ttl=None):
+        """POST through the cache, returns a CachedResponse"""
+        request = Request(url, "POST", headers=headers, data=data, json=json)
+        return self.fetch_request(request, timeout=timeout, ttl=ttl)
+
+    def fetch_wp_pages(self, url, timeout=10, ttl=None):
+        """
+        Fetch every page of a WordPress REST API listing, returns the
+        responses in page order. The first page says how many there are
+        (X-WP-TotalPages), then the others are fetched concurrently.
+        """
+        first = self.fetch_response(url, timeout=timeout, ttl=ttl)
+        if first.headers is None:
+            # Cached before we kept headers: fetch it again to find out
+            first = self.fetch_response(url, timeout=timeout, ttl=0)
+        pages = int((first.headers or {}).get("x-wp-totalpages", 1))
+        urls = [with_query(url, page=page) for page in range(2, pages + 1)]
+        return [first] + [response for _, response in self.fetch_many(urls, timeout, ttl)]
+
+    def graphql(self, url, query, variables=None, operation_name=None, headers=None,
+                timeout=10, ttl=None):
+        """
+        Run a GraphQL query through the cache and return the decoded JSON.
+        `query` can also be a full payload dict with query/variables/operationName.
+        """
+        if isinstance(query, dict):
+            payload = query
+        else:
+            payload = {"query": query, "variables": variables or {}}
+            if operation_name:
+                payload["operationName"] = operation_name
+        return self.post(url, json=payload, headers=headers, timeout=timeout, ttl=ttl).json()
+
+    def graphql_many(self, url, payloads, headers=None, timeout=10, ttl=None):
+        """Run a batch of GraphQL payloads concurrently, results in order"""
+        requests_ = [Request(url, "POST", headers=headers, json=payload) for payload in payloads]
+        return [
+            response.json()
+            for _, response in self.fetch_many(requests_, timeout=timeout, ttl=ttl)
+        ]
+
+    async def fetch_many_async(self, items, timeout=10, ttl=None, ordered=True,
+                               return_exceptions=False):
+        """
+        Fetch many URLs (or Requests), yielding (item, CachedResponse) pairs.
+
+        The cache is checked with one bulk query, then the misses are fetched
+        concurrently, at most host_limit(host) at a time per host, with
+        duplicate requests sharing one fetch. Results
+        come in the order of `items`, or as they complete if `ordered` is
+        False. With `return_exceptions`, a failed fetch yields
+        (item, exception) instead of raising.
+        """
+        items = list(items)
+        requests_ = [item if isinstance(item, Request) else Request(item) for item in items]
+        cached = self._store.get_many([request.key for request in requests_])
+
+        hits = {}
+        misses = {}
+        for i, request in enumerate(requests_):
+            response = cached.get(request.key)
+            if self.is_fresh(response, request.url, ttl):
+                hits[i] = response
+            else:
+                misses[i] = response
+
+        for i, response in hits.items():
+            self.stats.hit(response, host_of(requests_[i].url))
+
+        def checked(response):
+            if isinstance(response, Exception):
+                return response
+            try:
+                return response.raise_for_status()
+            except CachedHTTPError as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        if not misses:
+            for i, item in enumerate(items):
+                yield item, checked(hits[i])
+            return
+
+        loop = asyncio.get_running_loop()
+        hosts = {host_of(requests_[i].url) for i in misses}
+        semaphores = {host: asyncio.Semaphore(self.host_limit(host)) for host in hosts}
+        executor = ThreadPoolExecutor(
+            max_workers=sum(self.host_limit(host) for host in hosts),
+            thread_name_prefix="httpcache-fetch",
+        )
+
+        # Indexes of the items waiting for each missing key
+        waiting = {}
+        for i in misses:
+            waiting.setdefault(requests_[i].key, []).append(i)
+
+        async def load(key):
+            i = waiting[key][0]
+            request = requests_[i]
+            host = host_of(request.url)
+            try:
+                async with semaphores[host]:
+                    await self.limiter.acquire_async(host)
+                    return key, await loop.run_in_executor(
+                        executor,
+                        partial(self._fetch, request, misses[i], timeout, ttl, rate_limited=True),
+                    )
+            except Exception as e:
+                if return_exceptions:
+                    return key, e
+                raise
+
+        tasks = {key: asyncio.ensure_future(load(key)) for key in waiting}
+        try:
+            if ordered:
+                for i, item in enumerate(items):
+                    if i in hits:
+                        yield item, checked(hits[i])
+                    else:
+                        yield item, checked((await tasks[requests_[i].key])[1])
+            else:
+                for i, response in hits.items():
+                    yield items[i], checked(response)
+                for task in asyncio.as_completed(tasks.values()):
+                    key, response = await task
+                    for i in waiting[key]:
+                        yield items[i], checked(response)
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def fetch_many(self, items, timeout=10, ttl=None, ordered=True, return_exceptions=False):
+        """Synchronous version of fetch_many_async, for the scrapers"""
+        loop = asyncio.new_event_loop()
+        results = self.fetch_many_async(items, timeout=timeout, ttl=ttl, ordered=ordered,
+                                        return_exceptions=return_exceptions)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(results.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(results.aclose())
+            loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the scrapers' cache.db")
+    parser.add_argument("--db", help="path to the cache database (default: cache.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    evict = commands.add_parser("evict", help="delete old and least recently used responses "
+                                               "and parse results")
+    evict.add_argument("--max-size", type=parse_size,
+                       default=os.environ.get("HTTPCACHE_MAX_SIZE"),
+                       help="total size budget, like 500M (default: $HTTPCACHE_MAX_SIZE)")
+    evict.add_argument("--max-age", type=parse_duration,
+                       default=os.environ.get("HTTPCACHE_MAX_AGE"),
+                       help="drop responses unused for this long, like 90d "
+                            "(default: $HTTPCACHE_MAX_AGE)")
+    evict.add_argument("--host-max-age", action="append", default=[], metavar="HOST=AGE",
+                       help="max age for one host, can be repeated")
+    commands.add_parser("compact", help="vacuum cache.db to reclaim free space")
+    commands.add_parser("size", help="show how much each host takes up")
+
+    export = commands.add_parser("export", help="save one festival's responses to a snapshot file")
+    export.add_argument("snapshot", help="snapshot file to write")
+    export.add_argument("festival", nargs="?",
+                        help="festival directory in src/, like fantasia-2025")
+    export.add_argument("--host", action="append", default=[],
+                        help="host to export instead of a festival's, can be repeated")
+    import_ = commands.add_parser("import", help="load a snapshot file into the cache")
+    import_.add_argument("snapshot", nargs="+", help="snapshot files to read")
+    stats = commands.add_parser("stats", help="report hit rates, latencies and sizes")
+    stats.add_argument("file", nargs="?", default=os.environ.get("HTTPCACHE_STATS"),
+                       help="file the scrapers appended their stats to "
+                            "(default: $HTTPCACHE_STATS)")
+    stats.add_argument("--json", metavar="PATH", help="also write the report as JSON to PATH")
+
+    args = parser.parse_args()
+    cache = HTTPCache(args.db)
+    if args.command == "evict":
+        cache.max_bytes = args.max_size
+        cache.max_age = args.max_age
+        for item in args.host_max_age:
+            host, age = item.split("=", 1)
+            cache.max_ages[host] = parse_duration(age)
+        responses, parsed = cache.evict()
+        print(f"Evicted {responses} responses and {parsed} parse results")
+    elif args.command == "compact":
+        before = os.path.getsize(cache.db_path)
+        cache.compact()
+        after = os.path.getsize(cache.db_path)
+        print(f"Compacted {cache.db_path}: {before / 1024**2:.1f}M -> {after / 1024**2:.1f}M")
+    elif args.command == "export":
+        hosts = list(args.host)
+        if args.festival:
+            hosts += festival_hosts(args.festival)
+        if not hosts:
+            parser.error("export needs a festival or --host")
+        count = cache.export_snapshot(args.snapshot, hosts)
+        size = os.path.getsize(args.snapshot)
+        print(f"Exported {count} responses from {', '.join(hosts)} to "
+              f"{args.snapshot} ({size / 1024**2:.1f}M)")
+    elif args.command == "import":
+        for snapshot in args.snapshot:
+            print(f"Imported {cache.import_snapshot(snapshot)} responses from {snapshot}")
+    elif args.command == "size":
+        for host, count, size in cache.size_by_host():
+            print(f"{host:40} {count:6} responses {size / 1024**2:8.1f}M")
+        count, size = cache.parsed_size()
+        print(f"{'(parse results)':40} {count:6} results   {size / 1024**2:8.1f}M")
+    elif args.command == "stats":
+        summary = fetchstats.summarize(fetchstats.load(args.file) if args.file else [])
+        summary["stored"] = stored_by_festival(cache.size_by_host())
+        print(fetchstats.report(summary, summary["stored"]))
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
 
-        content = response.text
-        self.put(url, content)
 
-        return content
+if __name__ == "__main__":
+    main()
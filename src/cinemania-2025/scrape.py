@@ -2,55 +2,54 @@
 Scraper for Festival Cinemania using their GraphQL API
 """
 
-import json
-from datetime import datetime
 from pathlib import Path
 
-from dateutil import parser
-
 from src.cache import HTTPCache
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
+HOSTS = ["festivalcinemania.com"]
 
-def get_shows():
-    cache = HTTPCache()
+GRAPHQL_URL = "https://festivalcinemania.com/graphql"
 
-    # Get all dates in November 2025 for the festival
-    from datetime import datetime, timedelta
+# A film's "heure" in a program, "13:00" or "13h00"
+TIME_FORMATS = ["%H:%M", "%H:%M:%S", "%Hh%M"]
 
-    shows = []
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:143.0) Gecko/20100101 Firefox/143.0',
+    'Accept': '*/*',
+    'Accept-Language': 'en-CA,en-US;q=0.7,en;q=0.3',
+    'Referer': 'https://festivalcinemania.com/en/schedule',
+    'Origin': 'https://festivalcinemania.com',
+}
 
+# The whole edition is fetched in pages of PAGE_SIZE programs
+PAGE_SIZE = 100
+EDITION = {
+    "lang": "en",
+    "editionID": 10,
     # Festival runs November 5-16, 2025
-    start_date = datetime(2025, 11, 5)
-    end_date = datetime(2025, 11, 16)
-
-    current_date = start_date
-    while current_date <= end_date:
-        date_str = current_date.strftime("%Y-%m-%d")
-
-        # GraphQL query to get programs for this specific date
-        query = {
-            "operationName": "listingPrograms",
-            "variables": {
-                "limit": 99,
-                "lang": "en",
-                "currentdate": ["and", f">= {date_str} 00:00:00", f"<= {date_str} 23:59:59"],
-                "venue": None,
-                "editionID": 10
-            },
-            "query": """query listingPrograms($lang: [String], $venue: [String], $editionID: [QueryArgument], $currentdate: [QueryArgument], $currentID: QueryArgument, $limit: Int = 99) {
+    "dates": ["and", ">= 2025-11-05 00:00:00", "<= 2025-11-16 23:59:59"],
+}
+
+# Only what process_program uses. Films are shared between programs, so
+# programs just have their ids and FILMS_QUERY gets each film once
+PROGRAMS_QUERY = """query editionPrograms($lang: [String], $editionID: [QueryArgument], $dates: [QueryArgument], $limit: Int, $offset: Int) {
+  total: entryCount(
+    section: "program_zf"
+    site: $lang
+    program_edition_id: $editionID
+    program_date_start: $dates
+  )
   programs: entries(
     section: "program_zf"
     site: $lang
-    relatedToEntries: [{slug: $venue, site: $lang}]
     program_edition_id: $editionID
-    program_date_start: $currentdate
+    program_date_start: $dates
     limit: $limit
-    id: ["not", $currentID]
-    orderBy: "program_date_start ASC"
+    offset: $offset
+    orderBy: "program_date_start ASC, elements.id ASC"
   ) {
-    id
     url
     title
     program_ticket_url
@@ -63,80 +62,104 @@ def get_shows():
       heure
       film {
         id
-        url
-        title
-        select_category {
-          title
-        }
-        select_generic {
-          generic_post
-          generic_name_first
-          generic_name_last
-        }
-        select_section {
-          title
-        }
-        select_country {
-          title
-        }
-        film_image {
-          ... on film_image_bloc_film_image_BlockType {
-            image {
-              url
-              alt
-              title
-            }
-            principal
-            poster
-          }
-        }
       }
     }
   }
 }"""
+
+FILMS_QUERY = """query films($lang: [String], $ids: [QueryArgument], $limit: Int) {
+  films: entries(site: $lang, id: $ids, limit: $limit) {
+    id
+    url
+    title
+    select_category {
+      title
+    }
+    select_generic {
+      generic_post
+      generic_name_first
+      generic_name_last
+    }
+    select_section {
+      title
+    }
+    select_country {
+      title
+    }
+    film_image {
+      ... on film_image_bloc_film_image_BlockType {
+        image {
+          url
         }
+        poster
+      }
+    }
+  }
+}"""
+
+
+def programs_payload(offset):
+    return {
+        "operationName": "editionPrograms",
+        "variables": {**EDITION, "limit": PAGE_SIZE, "offset": offset},
+        "query": PROGRAMS_QUERY,
+    }
+
 
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:143.0) Gecko/20100101 Firefox/143.0',
-            'Accept': '*/*',
-            'Accept-Language': 'en-CA,en-US;q=0.7,en;q=0.3',
-            'Referer': f'https://festivalcinemania.com/en/schedule?day={current_date.strftime("%A").lower()}-{current_date.strftime("%B").lower()}-{current_date.day}',
-            'content-type': 'application/json',
-            'Origin': 'https://festivalcinemania.com',
+def get_programs(cache):
+    """Every program of the edition: the first page says how many pages there are"""
+    first = cache.graphql(GRAPHQL_URL, programs_payload(0), headers=HEADERS)
+    total = first["data"]["total"]
+    payloads = [programs_payload(offset) for offset in range(PAGE_SIZE, total, PAGE_SIZE)]
+    pages = [first] + cache.graphql_many(GRAPHQL_URL, payloads, headers=HEADERS)
+    programs = [program for page in pages for program in page["data"]["programs"]]
+    if len(programs) != total:
+        print(f"Cinemania: expected {total} programs, got {len(programs)}")
+    return programs
+
+
+def get_films(cache, ids):
+    """{film id: film} for the given ids"""
+    payloads = [
+        {
+            "operationName": "films",
+            "variables": {"lang": EDITION["lang"], "ids": ids[i:i + PAGE_SIZE], "limit": PAGE_SIZE},
+            "query": FILMS_QUERY,
         }
+        for i in range(0, len(ids), PAGE_SIZE)
+    ]
+    films = {}
+    for page in cache.graphql_many(GRAPHQL_URL, payloads, headers=HEADERS):
+        for film in page["data"]["films"]:
+            films[film["id"]] = film
+    return films
 
-        url = "https://festivalcinemania.com/graphql"
-
-        # Create a cache key that includes the POST data
-        import hashlib
-        cache_key = url + "_POST_" + hashlib.md5(json.dumps(query).encode()).hexdigest()
-
-        # Check cache first
-        cached = cache.get(cache_key)
-        if cached:
-            content = cached
-        else:
-            # Make POST request
-            import requests
-            import time
-            response = requests.post(url, json=query, headers=headers, timeout=10)
-            time.sleep(0.1)  # Rate limiting
-            response.raise_for_status()
-            content = response.text
-            cache.put(cache_key, content)
-
-        data = json.loads(content)
-
-        if data and 'data' in data and 'programs' in data['data']:
-            for program in data['data']['programs']:
-                try:
-                    program_shows = process_program(program)
-                    shows.extend(program_shows)
-                except Exception as e:
-                    print(f"Error processing program {program.get('title', 'Unknown')}: {e}")
-                    continue
 
-        current_date += timedelta(days=1)
+def get_shows():
+    cache = HTTPCache()
+
+    programs = get_programs(cache)
+    film_ids = sorted({
+        film["id"]
+        for program in programs
+        for film_entry in program.get("program_films") or []
+        for film in film_entry.get("film") or []
+    })
+    films = get_films(cache, film_ids)
+
+    shows = []
+    for program in programs:
+        # Put the full films back in the program, where process_program expects them
+        for film_entry in program.get("program_films") or []:
+            film_entry["film"] = [
+                films[film["id"]] for film in film_entry.get("film") or [] if film["id"] in films
+            ]
+        try:
+            program_shows = process_program(program)
+            shows.extend(program_shows)
+        except Exception as e:
+            print(f"Error processing program {program.get('title', 'Unknown')}: {e}")
+            continue
 
     return shows
 
@@ -211,7 +234,7 @@ def process_program(program):
         # Use program start time
         if program_date:
             try:
-                program_dt = parser.parse(program_date)
+                program_dt = showlib.parse_datetime(program_date)
                 showtime = Showtime(program_dt, venue_name)
 
                 show = Show(
@@ -290,9 +313,9 @@ def process_program(program):
             if time_str and program_date:
                 try:
                     # Parse the time from heure field
-                    time_dt = parser.parse(time_str)
+                    time_dt = showlib.parse_datetime(time_str, formats=TIME_FORMATS)
                     # Parse the program date
-                    program_dt = parser.parse(program_date)
+                    program_dt = showlib.parse_datetime(program_date)
                     # Combine the correct date with the time
                     combined_dt = program_dt.replace(
                         hour=time_dt.hour,
@@ -317,9 +340,8 @@ def process_program(program):
 
 
 def main():
-    shows = get_shows()
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "Cinemania")
+    return showlib.scrape(get_shows, shows_file, "Cinemania")
 
 
 if __name__ == "__main__":
@@ -3,70 +3,139 @@ Fetch Fantasia program data directly from the API and convert to fringe format
 """
 
 import json
-from datetime import datetime, timedelta
+from datetime import date, datetime
 from pathlib import Path
 
-from bs4 import BeautifulSoup
-from dateutil import parser
+from bs4 import Tag
+import soupsieve
 
-from src.cache import HTTPCache
+from src.cache import HTTPCache, Request
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
+HOSTS = ["fantasiafestival.com"]
 
-def get_shows():
-    cache = HTTPCache()
-
-    start_dt = datetime(2025, 7, 16)
-    end_dt = datetime(2025, 8, 3)
 
-    shows = []
+def day_request(day):
+    current_date = datetime(day.year, day.month, day.day)
+    timestamp = int(current_date.timestamp()) + (
+        5 * 3600
+    )  # Montreal timezone offset
+    url = f"https://fantasiafestival.com/en/api/horaire/{timestamp}/program"
 
-    current_date = start_dt
-    while current_date <= end_dt:
-        timestamp = int(current_date.timestamp()) + (
-            5 * 3600
-        )  # Montreal timezone offset
-        url = f"https://fantasiafestival.com/en/api/horaire/{timestamp}/program"
+    headers = {
+        "Referer": f"https://fantasiafestival.com/en/schedule?date={current_date.strftime('%Y-%m-%d')}"
+    }
+    return Request(url, headers=headers)
 
-        headers = {
-            "Referer": f"https://fantasiafestival.com/en/schedule?date={current_date.strftime('%Y-%m-%d')}"
-        }
 
-        content = cache.fetch(url, headers=headers, timeout=10)
-        data = json.loads(content)
+def parse_day(response, day):
+    data = json.loads(response.content)
+    if not data:
+        return []
 
-        if data:
-            for x in data["data"]:
-                try:
-                    shows.append(process_event(x))
-                except Exception:
-                    print(x)
-                    raise
+    # Parse all the events we haven't seen before as one document, instead
+    # of starting a new parser for every event
+    events = data["data"]
+    results = [process_event.lookup(event) for event in events]
+    misses = [i for i, (_, show) in enumerate(results) if show is showlib.MISSING]
+    elements = event_elements([events[i]["html"] for i in misses])
+    for i, element in zip(misses, elements):
+        digest, _ = results[i]
+        try:
+            show = event_show(events[i], element)
+        except Exception:
+            print(events[i])
+            raise
+        results[i] = (digest, process_event.remember(digest, show))
 
-        current_date += timedelta(days=1)
+    return [show for _, show in results]
 
-    return shows
 
+PLAN = showlib.DatePlan(date(2025, 7, 16), date(2025, 8, 3), day_request, parse_day)
 
 
+def get_shows():
+    return PLAN.run(HTTPCache())
+
+
+# Wraps each event's HTML when a day's events are parsed together
+EVENT_TAG = "fantasia-event"
+
+DIRECTOR = soupsieve.compile(".block--media__content__visible  .small")
+SPECS = soupsieve.compile(".block--media__specs span")
+DESCRIPTION = soupsieve.compile(".block--media__content__hidden")
+
+
+def event_elements(fragments):
+    """
+    Parse several events' HTML as one document, returns an element for each
+    event. If an event's broken HTML runs into the next one, they're parsed
+    one at a time instead.
+    """
+    elements = parse_together(fragments)
+    if elements is None:
+        elements = []
+        for html in fragments:
+            element = parse_together([html])
+            if element is None:
+                raise ValueError(f"couldn't parse this event's HTML: {html[:200]!r}")
+            elements.extend(element)
+    return elements
+
+
+def parse_together(fragments):
+    """One element per fragment, or None if they didn't come out that way"""
+    document = "".join(f"<{EVENT_TAG}>{html}</{EVENT_TAG}>" for html in fragments)
+    elements = showlib.soup(document).find_all(EVENT_TAG)
+    # an unclosed tag in one event swallows the events after it
+    if len(elements) != len(fragments) or any(
+        element.find_parent(EVENT_TAG) is not None for element in elements
+    ):
+        return None
+    return elements
+
+
+def event_fields(element):
+    """The tags we use from an event's HTML, found in one walk over it"""
+    fields = {"director": None, "link": None, "specs": [], "description": None, "image": None}
+    for tag in element.descendants:
+        if not isinstance(tag, Tag):
+            continue
+        if tag.name == "a" and fields["link"] is None:
+            fields["link"] = tag
+        elif tag.name == "img" and fields["image"] is None:
+            fields["image"] = tag
+        if fields["director"] is None and DIRECTOR.match(tag):
+            fields["director"] = tag
+        if fields["description"] is None and DESCRIPTION.match(tag):
+            fields["description"] = tag
+        if SPECS.match(tag):
+            fields["specs"].append(tag)
+    return fields
+
+
+@showlib.memoize("fantasia", version=1)
 def process_event(event):
-    soup = BeautifulSoup(event["html"], "html.parser")
+    return event_show(event, event_elements([event["html"]])[0])
+
+
+def event_show(event, element):
+    fields = event_fields(element)
     director = ""
-    director_div = soup.select_one(".block--media__content__visible  .small")
-    if director_div is not None:
-        director = director_div.text
-    url = soup.find("a")["href"]
-    country = soup.select_one(".block--media__specs span").text
-    description = soup.select_one(".block--media__content__hidden").text.strip()
-
-    duration = soup.select(".block--media__specs span")[1].text
+    if fields["director"] is not None:
+        director = fields["director"].text
+    url = fields["link"]["href"]
+    country = fields["specs"][0].text
+    description = fields["description"].text.strip()
+
+    duration = fields["specs"][1].text
     assert 'mins' in duration
     duration = int(duration.split()[0])
 
     # Extract image
     image_url = ""
-    img_tag = soup.find("img")
+    img_tag = fields["image"]
     if img_tag:
         srcset = img_tag.get("data-srcset", "")
         if srcset:
@@ -77,7 +146,7 @@ def process_event(event):
         if image_url and not image_url.startswith("http"):
             image_url = "https://fantasiafestival.com" + image_url
 
-    showtime = Showtime(parser.parse(event["exactTime"]))
+    showtime = Showtime(showlib.parse_datetime(event["exactTime"]))
     return Show(
         title=event["titre"],
         showtimes=[showtime],
@@ -100,9 +169,8 @@ def remove_dups(shows_list):
 
 
 def main():
-    shows = remove_dups(get_shows())
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "Fantasia")
+    return showlib.scrape(lambda: remove_dups(get_shows()), shows_file, "Fantasia")
 
 
 if __name__ == "__main__":
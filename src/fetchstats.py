@@ -0,0 +1,170 @@
+"""
+Counters for every lookup and fetch HTTPCache makes, and the stats report
+"""
+
+import atexit
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+# How many of the slowest fetches the report lists
+SLOWEST_COUNT = 10
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, math.ceil(fraction * len(values)) - 1)
+    return values[index]
+
+
+class FetchStats:
+    """
+    In-memory log of cache hits and misses.
+
+    A miss that went to the network records its status (or the name of the
+    exception it raised), downloaded bytes and latency; a plain lookup that
+    found nothing has no status. If
+    `path` is set (default: $HTTPCACHE_STATS) the log is appended to that
+    file as one JSON line when the process exits.
+    """
+
+    def __init__(self, path=None):
+        self.records = []
+        self.lock = threading.Lock()
+        self.path = path if path is not None else os.environ.get("HTTPCACHE_STATS")
+        if self.path:
+            atexit.register(self.append_to, self.path)
+
+    def record(self, url, host, hit, status=None, size=0, seconds=0.0):
+        with self.lock:
+            self.records.append({
+                "url": url,
+                "host": host,
+                "hit": hit,
+                "status": status,
+                "bytes": size,
+                "seconds": seconds,
+            })
+
+    def hit(self, response, host):
+        self.record(response.url, host, True, response.status)
+
+    def append_to(self, path):
+        with self.lock:
+            if not self.records:
+                return
+            line = json.dumps({
+                "time": time.time(),
+                "argv": sys.argv,
+                "records": self.records,
+            })
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def summary(self):
+        with self.lock:
+            return summarize(self.records)
+
+
+def load(path):
+    """
+    All the records appended to a stats file. A missing file means nothing
+    was fetched: append_to doesn't write anything then.
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.extend(json.loads(line)["records"])
+    return records
+
+
+def summarize(records):
+    hosts = defaultdict(lambda: {"requests": 0, "hits": 0, "errors": 0, "bytes": 0, "latencies": []})
+    for record in records:
+        host = hosts[record["host"]]
+        host["requests"] += 1
+        if record["hit"]:
+            host["hits"] += 1
+        elif record["status"] is not None:
+            # a miss that went to the network, not just a lookup
+            host["bytes"] += record["bytes"]
+            host["latencies"].append(record["seconds"])
+        # status is an exception name when the fetch raised
+        if isinstance(record["status"], str) or (record["status"] or 0) >= 400:
+            host["errors"] += 1
+
+    summary = {"hosts": {}}
+    for name, host in sorted(hosts.items(), key=lambda item: -item[1]["requests"]):
+        latencies = host.pop("latencies")
+        summary["hosts"][name] = {
+            **host,
+            "misses": host["requests"] - host["hits"],
+            "hit_rate": host["hits"] / host["requests"],
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+        }
+    total = len(records)
+    hits = sum(1 for record in records if record["hit"])
+    summary["requests"] = total
+    summary["hit_rate"] = hits / total if total else None
+    summary["slowest"] = [
+        {"url": record["url"], "seconds": record["seconds"], "status": record["status"]}
+        for record in sorted(
+            (record for record in records if not record["hit"] and record["status"] is not None),
+            key=lambda record: -record["seconds"],
+        )[:SLOWEST_COUNT]
+    ]
+    return summary
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    return f"{seconds * 1000:.0f}ms"
+
+
+def report(summary, stored=None):
+    """
+    Human readable version of summarize()'s output. `stored` maps festival
+    names to (responses, bytes) in cache.db.
+    """
+    lines = []
+    if summary["requests"]:
+        lines.append(f"{summary['requests']} requests, {summary['hit_rate']:.0%} from the cache")
+    else:
+        lines.append("no requests")
+    lines.append("")
+    lines.append(f"{'host':40} {'requests':>8} {'hit rate':>8} {'errors':>6} "
+                 f"{'downloaded':>10} {'p50':>7} {'p95':>7}")
+    for name, host in summary["hosts"].items():
+        lines.append(
+            f"{name:40} {host['requests']:8} {host['hit_rate']:8.0%} {host['errors']:6} "
+            f"{host['bytes'] / 1024**2:9.1f}M {format_seconds(host['p50']):>7} "
+            f"{format_seconds(host['p95']):>7}"
+        )
+    if summary["slowest"]:
+        lines.append("")
+        lines.append("slowest fetches:")
+        for record in summary["slowest"]:
+            lines.append(f"  {format_seconds(record['seconds']):>7} {record['status']} {record['url']}")
+    if stored:
+        lines.append("")
+        lines.append("stored in cache.db:")
+        for festival, (count, size) in stored.items():
+            lines.append(f"  {festival:38} {count:6} responses {size / 1024**2:8.1f}M")
+    return "\n".join(lines)
+
+
+# Shared by default, like the rate limiter, so one report covers every
+# scraper running in the process
+default_stats = FetchStats()
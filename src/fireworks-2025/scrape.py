@@ -1,12 +1,16 @@
 from pathlib import Path
 
-from bs4 import BeautifulSoup
-from dateutil import parser
+from bs4 import CData, NavigableString, SoupStrainer, Tag
 
 from src.cache import HTTPCache
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
+HOSTS = ["www.sixflags.com"]
+
+# The program is in the body, so don't bother parsing the <head>
+BODY_REGION = SoupStrainer("body")
+
 
 def scrape_fireworks_data():
     cache = HTTPCache()
@@ -20,11 +24,8 @@ def scrape_fireworks_data():
 
     main_url = "https://www.sixflags.com/larondeen/linternational-des-feux/program"
     content = cache.fetch(main_url, headers=headers, timeout=10)
-    soup = BeautifulSoup(content, "html.parser")
-    for link in soup.find_all("a"):
-        if link.get("href"):
-            link.replace_with(link["href"])
-    parts = soup.get_text().split("\n")
+    soup = showlib.soup(content, parse_only=BODY_REGION)
+    parts = text_with_links(soup).split("\n")
     parts = [p.strip() for p in parts]
     parts = [p for p in parts if len(p.strip()) > 0]
     idx = parts.index("Program")
@@ -38,9 +39,9 @@ def scrape_fireworks_data():
             events.add((date, title, url))
 
     shows = []
-    sorted_events = sorted(events, key=lambda x: parser.parse(x[0]))
+    sorted_events = sorted(events, key=lambda x: showlib.parse_datetime(x[0], formats=["%B %d, %Y"]))
     for date_str, title, url in sorted_events:
-        parsed_date = parser.parse(date_str)
+        parsed_date = showlib.parse_datetime(date_str, formats=["%B %d, %Y"])
         show_date = parsed_date.replace(hour=22, minute=0, second=0, microsecond=0)
 
         showtime = Showtime(show_date, "")
@@ -50,13 +51,33 @@ def scrape_fireworks_data():
     return shows
 
 
+def text_with_links(tag):
+    """Like tag.get_text(), but with every link replaced by its URL"""
+    return "".join(strings_with_links(tag))
+
+
+def strings_with_links(tag):
+    for child in tag.children:
+        if isinstance(child, Tag):
+            if child.name == "a" and child.get("href"):
+                yield child["href"]
+            else:
+                yield from strings_with_links(child)
+        # what get_text() includes: not comments, scripts or styles
+        elif type(child) in (NavigableString, CData):
+            yield child
+
+
 def get_url(parts, i):
     for p in parts[i:]:
         if "http" in p:
             return p
 
 
-if __name__ == "__main__":
-    shows = scrape_fireworks_data()
+def main():
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "Fireworks")
+    return showlib.scrape(scrape_fireworks_data, shows_file, "Fireworks")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
 import json
 import os
 import shutil
-from datetime import datetime, timedelta
+from datetime import timedelta
 from pathlib import Path
 from collections import defaultdict
 
 from jinja2 import Environment, FileSystemLoader
 from bs4 import BeautifulSoup
+from src.showlib import parse_datetime
 
 
 def build_date_range(events_by_date):
@@ -26,7 +27,7 @@ def flatten(events):
     # Get one item per showtime
     for event in events:
         for showtime in event["showtimes"]:
-            dt = datetime.strptime(showtime["datetime"], "%Y-%m-%d %H:%M:%S")
+            dt = parse_datetime(showtime["datetime"])
             event_entry = event.copy()
             event_entry["datetime"] = dt
             event_entry["time"] = dt.strftime("%H:%M")
@@ -117,6 +118,8 @@ def render_calendar(calendar_html_path, shows_json_path, output_dir):
         start_weekday=calendar_dates[0].weekday(),
         festivals_metadata=festivals_metadata,
     )
+    # Always html.parser, not showlib.soup(): lxml moves nested <p>s around,
+    # which changes the calendars' markup
     soup = BeautifulSoup(html, "html.parser")
     html = soup.prettify()
 
@@ -7,18 +7,21 @@ import json
 from pathlib import Path
 from datetime import datetime
 
-from dateutil import parser
-
-from src.cache import HTTPCache
+from src.cache import HTTPCache, with_query
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
+HOSTS = ["montreal.haitienfolie.com"]
+
 
-def scrape_haiti_en_folie_data():
+def scrape_haiti_en_folie_data(modified_after=None):
+    """All the shows, or only the ones modified after a datetime"""
     cache = HTTPCache()
     url = "https://montreal.haitienfolie.com/wp-json/festival/v1/events?per_page=100"
-    content = cache.fetch(url, timeout=10)
-    data = json.loads(content)
+    if modified_after:
+        url = with_query(url, modified_after=modified_after.strftime("%Y-%m-%dT%H:%M:%S"),
+                         orderby="modified")
+    data = merge_pages([page.json() for page in cache.fetch_wp_pages(url, timeout=10)])
     
     
     shows = []
@@ -55,6 +58,19 @@ def scrape_haiti_en_folie_data():
     return shows
 
 
+def merge_pages(pages):
+    """Concatenate the pages of the API response, a list or a dict of lists"""
+    data = pages[0]
+    for page in pages[1:]:
+        if isinstance(data, list):
+            data += page
+            continue
+        for key, value in page.items():
+            if isinstance(value, list):
+                data.setdefault(key, []).extend(value)
+    return data
+
+
 def parse_event(event, venues=None):
     """Parse an event from the API response"""
     if venues is None:
@@ -73,7 +89,7 @@ def parse_event(event, venues=None):
     try:
         # Combine date and time strings
         datetime_str = f"{date_str} {time_str}"
-        dt = parser.parse(datetime_str)
+        dt = showlib.parse_datetime(datetime_str)
     except:
         return None
     
@@ -92,7 +108,9 @@ def parse_event(event, venues=None):
     
     # Build extra data
     extra = {
-        "festival": "Haïti en Folie"
+        "festival": "Haïti en Folie",
+        # to merge incremental syncs by, see main()
+        "event_id": event.get('id'),
     }
     
     if description:
@@ -133,9 +151,12 @@ def parse_event(event, venues=None):
 
 
 def main():
-    shows = scrape_haiti_en_folie_data()
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "Haiti en Folie")
+    # Several events can share a post (and so a link and even a title), or
+    # have no link at all, so changes are merged by the API's event id
+    return showlib.scrape(scrape_haiti_en_folie_data, shows_file, "Haiti en Folie",
+                          get_changes=scrape_haiti_en_folie_data,
+                          key=lambda show: (show.extra or {}).get("event_id"))
 
 
 if __name__ == "__main__":
@@ -2,61 +2,58 @@
 ItalfestMTL scraper - fetches festival data
 """
 
-import json
 import re
 from pathlib import Path
-from urllib.parse import urljoin
 
-from dateutil import parser
-from bs4 import BeautifulSoup
-
-from src.cache import HTTPCache
+from src.cache import HTTPCache, with_query
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
+HOSTS = ["italfestmtl.ca"]
+
 
-def get_shows():
+def get_shows(modified_after=None):
+    """All the shows, or only the ones modified after a datetime"""
     cache = HTTPCache()
     
     url = "https://italfestmtl.ca/wp-json/wp/v2/evenements?per_page=100&lang=en"
-    content = cache.fetch(url, timeout=10)
-    events_data = json.loads(content)
+    if modified_after:
+        url = with_query(url, modified_after=modified_after.strftime("%Y-%m-%dT%H:%M:%S"),
+                         orderby="modified")
+    events_data = [
+        event for page in cache.fetch_wp_pages(url, timeout=10) for event in page.json()
+    ]
     
     shows = []
-    
     for event in events_data:
-        title = event["title"]["rendered"]
-        link = event["link"]
-
         # Extract content and parse event details
         content_html = event["content"]["rendered"]
-        soup = BeautifulSoup(content_html, "html.parser")
+        soup = showlib.soup(content_html)
         content_text = soup.get_text()
 
-        # Parse event details from individual event page
-        event_page = cache.fetch(link, timeout=10)
-        event_soup = BeautifulSoup(event_page, "html.parser")
-
-        # Parse date/time and venue from HTML selectors
-        showtimes = parse_event_details_from_html(event_soup)
-        if not showtimes:
-            continue
-
-        # Extract image
-        image_url = extract_image(event_soup, link)
-
         show = Show(
-            title=title,
-            showtimes=showtimes,
-            link=link,
+            title=event["title"]["rendered"],
+            showtimes=[],
+            link=event["link"],
             extra={
                 "description": content_text[:500] if content_text else "",
-                "image": image_url,
+                "image": None,
             },
         )
         shows.append(show)
 
-    return shows
+    # The dates, venue and image are on the event pages. When syncing, we
+    # know they changed so don't use the cached copies
+    showlib.enrich(cache, shows, parse_event_page, ttl=0 if modified_after else None)
+    return [show for show in shows if show.showtimes]
+
+
+def parse_event_page(content):
+    event_soup = showlib.soup(content)
+    return {
+        "showtimes": parse_event_details_from_html(event_soup),
+        "image": extract_image(event_soup),
+    }
 
 
 def parse_event_details_from_html(soup):
@@ -108,7 +105,7 @@ def parse_datetime_from_text(text):
 
     dts = []
     for time in times:
-        dts.append(parser.parse(f"{date} {time}"))
+        dts.append(showlib.parse_datetime(f"{date} {time}"))
     return dts
 
 
@@ -116,20 +113,19 @@ def clean_venue_text(text):
     # Remove long addresses
     return re.sub(r"\s+\d{3,}.*", "", text).strip()
 
-def extract_image(soup, base_url):
+def extract_image(soup):
     """Extract the main event image from the page."""
     # Try elementor featured image first
     elementor_img = soup.find('div', class_='elementor-widget-theme-post-featured-image')
     if elementor_img:
         img = elementor_img.find('img')
         if img and img.get('src'):
-            return urljoin(base_url, img['src'])
+            return img['src']
     return None
 
 def main():
-    shows = get_shows()
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "Italfest")
+    return showlib.scrape(get_shows, shows_file, "Italfest", get_changes=get_shows)
 
 
 if __name__ == "__main__":
@@ -1,31 +1,37 @@
 import json
+from datetime import date
 from pathlib import Path
 
-from bs4 import BeautifulSoup
-from dateutil import parser
+from bs4 import SoupStrainer
 
 from src.cache import HTTPCache
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
+HOSTS = ["montreal.mutek.org"]
+
+# Only the shows get parsed
+SHOWS_REGION = SoupStrainer(class_="single-show")
+
+BASE_URL = "https://montreal.mutek.org/ajax/programs/920"
 
-def scrape_mutek_data():
-    cache = HTTPCache()
 
-    all_events = []
+def parse_day(response, day):
+    data = json.loads(response.content)
+    soup = showlib.soup(data["html"], parse_only=SHOWS_REGION)
+    return parse_events_for_date(soup, day.strftime("%d.%m"))
 
-    base_url = "https://montreal.mutek.org/ajax/programs/920"
-    dates = ["19.08", "20.08", "21.08", "22.08", "23.08", "24.08"]
 
-    for date in dates:
-        url = f"{base_url}?date={date}"
-        content = cache.fetch(url, timeout=10)
-        data = json.loads(content)
-        soup = BeautifulSoup(data["html"], "html.parser")
-        events = parse_events_for_date(soup, date)
-        all_events.extend(events)
+PLAN = showlib.DatePlan(
+    date(2025, 8, 19),
+    date(2025, 8, 24),
+    lambda day: f"{BASE_URL}?date={day:%d.%m}",
+    parse_day,
+)
 
-    return all_events
+
+def scrape_mutek_data():
+    return PLAN.run(HTTPCache())
 
 
 def parse_event(soup, date_str):
@@ -60,7 +66,7 @@ def parse_event(soup, date_str):
     time_text = date_info[1].text.strip()  # "6:30 pm_11:00 pm"
     start_time = time_text.split("_")[0].strip()  # "6:30 pm"
     datetime_str = f"2025-08-{date_str.split('.')[0]} {start_time}"
-    dt = parser.parse(datetime_str)
+    dt = showlib.parse_datetime(datetime_str, formats=["%Y-%m-%d %I:%M %p"])
 
     showtime = Showtime(dt, venue)
 
@@ -87,9 +93,8 @@ def parse_events_for_date(soup, date_str):
 
 
 def main():
-    shows = scrape_mutek_data()
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "MUTEK")
+    return showlib.scrape(scrape_mutek_data, shows_file, "MUTEK")
 
 
 if __name__ == "__main__":
@@ -1,18 +1,22 @@
 from pathlib import Path
 
-from bs4 import BeautifulSoup
-from dateutil import parser
+from bs4 import SoupStrainer
 
 from src.cache import HTTPCache
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
+HOSTS = ["www.festivalnuitsdafrique.com"]
+
+CARDS_REGION = SoupStrainer(class_="event-card")
+DETAILS_REGION = SoupStrainer(class_=["text-container", "description", "img-cont"])
+
 
 def scrape_nuits_afrique_data():
     cache = HTTPCache()
     url = "https://www.festivalnuitsdafrique.com/en/programmation-festival-nuits-dafrique-2025-gratuit/?category=664&concert=yes"
     content = cache.fetch(url, timeout=10)
-    soup = BeautifulSoup(content, "html.parser")
+    soup = showlib.soup(content, parse_only=CARDS_REGION)
 
     shows = []
 
@@ -20,15 +24,16 @@ def scrape_nuits_afrique_data():
 
     for card in event_cards:
         try:
-            shows.append(parse_event_card(card, cache))
+            shows.append(parse_event_card(card))
         except Exception:
             print(card.prettify())
             raise
 
-    return shows
+    # Descriptions and images are on the detail pages
+    return showlib.enrich(cache, shows, parse_event_details)
 
 
-def parse_event_card(card, cache):
+def parse_event_card(card):
     """Parse a single event card to extract show information"""
     artist = card.find(class_="event-card-title").text.strip()
 
@@ -44,13 +49,24 @@ def parse_event_card(card, cache):
     time_text = time_elem.get_text().strip()
 
     date_string = f"{day_number} {month_name} 2025 {time_text}"
-    dt = parser.parse(date_string)
+    dt = showlib.parse_datetime(date_string)
 
     link = card.get("href")
 
+    showtime = Showtime(dt)
+    return Show(
+        title=artist,
+        showtimes=[showtime],
+        link=link,
+        extra={},
+    )
+
+
+def parse_event_details(detail_content):
+    """Get the description and image from an event's detail page"""
     image = ""
-    detail_content = cache.fetch(link, timeout=10)
-    detail_soup = BeautifulSoup(detail_content, "html.parser")
+    description = ""
+    detail_soup = showlib.soup(detail_content, parse_only=DETAILS_REGION)
 
     # Extract description
     desc_elem = detail_soup.select_one(".text-container")
@@ -69,16 +85,10 @@ def parse_event_card(card, cache):
         if image and not image.startswith("http"):
             image = "https://www.festivalnuitsdafrique.com" + image
 
-    showtime = Showtime(dt)
-    return Show(
-        title=artist,
-        showtimes=[showtime],
-        link=link,
-        extra={
-            "image": image,
-            "description": description,
-        },
-    )
+    return {
+        "image": image,
+        "description": description,
+    }
 
 
 def extract_venue(card):
@@ -96,9 +106,8 @@ def extract_venue(card):
 
 
 def main():
-    shows = scrape_nuits_afrique_data()
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "Nuits D'Afrique")
+    return showlib.scrape(scrape_nuits_afrique_data, shows_file, "Nuits D'Afrique")
 
 
 if __name__ == "__main__":
@@ -1,23 +1,29 @@
 from datetime import datetime
 from pathlib import Path
 import re
-from concurrent.futures import ThreadPoolExecutor
 
-from bs4 import BeautifulSoup
-from dateutil import parser
+from bs4 import SoupStrainer
 from html_sanitizer.sanitizer import Sanitizer
 
 from src.cache import HTTPCache
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
+HOSTS = ["presenceautochtone.ca"]
+
+LISTING_REGION = SoupStrainer(class_="uk-filter-container")
+DETAILS_REGION = SoupStrainer(class_=["uk-text", "uk-cover-container"])
+
+# How many detail pages to fetch at the same time
+DETAIL_WORKERS = 8
+
 
 def get_shows():
-    cache = HTTPCache()
+    cache = HTTPCache(pool_size=DETAIL_WORKERS)
 
     url = "https://presenceautochtone.ca/en/the-festival/calendar/"
     content = cache.fetch(url, timeout=10)
-    soup = BeautifulSoup(content, "html.parser")
+    soup = showlib.soup(content, parse_only=LISTING_REGION)
 
     shows = []
     container = soup.find(class_="uk-filter-container")
@@ -42,9 +48,10 @@ def get_shows():
         show = Show(title=title, showtimes=showtimes, link=url, extra={})
         shows.append(show)
 
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        shows = list(executor.map(lambda s: fetch_description(cache, s), shows))
-    return shows
+    headers = {
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:141.0) Gecko/20100101 Firefox/141.0"
+    }
+    return showlib.enrich(cache, shows, parse_description, headers=headers)
 
 def parse_dates(date_text):
     results = []
@@ -55,30 +62,27 @@ def parse_dates(date_text):
         time = re.sub(r"(de|from)", "", time, flags=re.I)
         time = re.sub(r"(à|to).*", "", time, flags=re.I) # ignore end times
         time = re.sub(r"pm pm", "pm", time) # silly typo
-        results.append(parser.parse(f"{day} {time}"))
+        results.append(showlib.parse_datetime(f"{day} {time}"))
 
     return results
 
-def fetch_description(cache, show):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:141.0) Gecko/20100101 Firefox/141.0"
-    }
-    content = cache.fetch(show.link, headers=headers, timeout=10)
-    soup = BeautifulSoup(content, "html.parser")
+@showlib.memoize("presence-autochtone", version=1)
+def parse_description(content):
+    soup = showlib.soup(content, parse_only=DETAILS_REGION)
+    details = {}
 
     if (text_wrapper := soup.find(class_="uk-text")):
-        show.extra["description"] = Sanitizer().sanitize(text_wrapper.decode_contents())
+        details["description"] = Sanitizer().sanitize(text_wrapper.decode_contents())
 
     if (cover_wrapper := soup.find(class_="uk-cover-container")):
         if (cover_img := cover_wrapper.find("img")):
-            show.extra["image"] = cover_img["data-src"]
+            details["image"] = cover_img["data-src"]
 
-    return show
+    return details
 
 def main():
-    shows = get_shows()
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "Présence Autochtone")
+    return showlib.scrape(get_shows, shows_file, "Présence Autochtone")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,219 @@
+"""
+Per-host token bucket rate limiting and circuit breakers, shared by every
+HTTPCache in the process
+"""
+
+import asyncio
+import email.utils
+import threading
+import time
+
+# Default politeness: 10 requests per second per host, in bursts of up to 5
+DEFAULT_RATE = 10
+DEFAULT_BURST = 5
+
+# How far adaptive backoff can slow a host down, as a fraction of its rate
+MIN_RATE_FACTOR = 1 / 16
+
+# The longest a Retry-After can pause a host for, in seconds (the cache gives
+# up on requests that are asked to wait longer)
+MAX_PAUSE = 10
+
+# A host's circuit opens after this many failures in a row, and stays open
+# (failing requests immediately) for BREAKER_COOLDOWN seconds
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 60
+
+
+def parse_retry_after(value):
+    """Seconds to wait according to a Retry-After header, or None"""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average and bursts of `burst`.
+
+    Callers reserve a token under a lock and then sleep outside it, so the
+    bucket works from threads (`acquire`) and coroutines (`acquire_async`).
+    The token count goes negative when callers are queued up.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returns how many seconds to wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def backoff(self, retry_after=None):
+        """The server is overloaded (429/503): halve the rate and pause"""
+        with self.lock:
+            self.rate = max(self.max_rate * MIN_RATE_FACTOR, self.rate / 2)
+            pause = min(retry_after, MAX_PAUSE) if retry_after is not None else 1 / self.rate
+            # Refilling starts again only once the pause is over
+            self.tokens = min(self.tokens, 0)
+            self.updated = max(self.updated, time.monotonic() + pause)
+
+    def recover(self):
+        """A request went fine: creep back up towards the configured rate"""
+        if self.rate < self.max_rate:
+            with self.lock:
+                self.rate = min(self.max_rate, self.rate * 1.25)
+
+    def limit(self, rate, burst):
+        """Change the configured rate, staying as far backed off as we are"""
+        with self.lock:
+            self.rate = rate * self.rate / self.max_rate
+            self.max_rate = rate
+            self.burst = burst
+            self.tokens = min(self.tokens, burst)
+
+
+class RateLimiter:
+    """A TokenBucket per host; `limits` maps hosts to (rate, burst)"""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, limits=None):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        # The (rate, burst) configure() was given for each host
+        self.limits = {}
+        self.lock = threading.Lock()
+        for host, (host_rate, host_burst) in (limits or {}).items():
+            self.configure(host, host_rate, host_burst)
+
+    def configure(self, host, rate, burst=None):
+        """
+        Set a host's rate. Every HTTPCache configures its rate_limits, so
+        configuring the same rate again is a no-op (and keeps the host's
+        backoff), while a different one raises ValueError.
+        """
+        host = host.lower()
+        limit = (rate, burst or self.burst)
+        with self.lock:
+            configured = self.limits.get(host)
+            if configured == limit:
+                return
+            if configured is not None:
+                raise ValueError(f"{host} is already limited to {configured[0]} requests "
+                                 f"per second in bursts of {configured[1]}")
+            self.limits[host] = limit
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                self.buckets[host] = TokenBucket(*limit)
+            else:
+                # it was already used at the default rate
+                bucket.limit(*limit)
+
+    def bucket(self, host):
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def acquire(self, host):
+        self.bucket(host).acquire()
+
+    async def acquire_async(self, host):
+        await self.bucket(host).acquire_async()
+
+    def backoff(self, host, retry_after=None):
+        self.bucket(host).backoff(retry_after)
+
+    def recover(self, host):
+        self.bucket(host).recover()
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a host that keeps failing.
+
+    After `threshold` consecutive failures the circuit opens and `allow()`
+    returns False for `cooldown` seconds. After that, requests are let
+    through again; one more failure reopens it, a success closes it.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            return self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class CircuitBreakers:
+    """A CircuitBreaker per host"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def breaker(self, host):
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(self.threshold, self.cooldown)
+            return breaker
+
+    def allow(self, host):
+        return self.breaker(host).allow()
+
+    def success(self, host):
+        self.breaker(host).success()
+
+    def failure(self, host):
+        self.breaker(host).failure()
+
+
+# Shared by default so that every scraper thread in a process is polite together
+default_limiter = RateLimiter()
+default_breakers = CircuitBreakers()
@@ -0,0 +1,151 @@
+"""
+Run every festival's scraper at the same time, in one process.
+
+The scrapers spend nearly all their time waiting on the network, so running
+them in threads takes about as long as the slowest one instead of the sum of
+all of them. Being in one process, they share cache.db's writer, the
+per-host rate limits and circuit breakers and the fetch stats. A scraper
+that fails doesn't stop the others.
+
+Exits with 1 if a scraper failed, or 2 if some only kept their last good
+shows.json because fetching failed. Usage:
+
+    PYTHONPATH=. python3 src/scrape.py [festival ...] [--jobs N] [--incremental]
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from src.cache import PROJECT_ROOT
+import src.showlib as showlib
+
+# How many scrapers run at once, unless --jobs or $SCRAPE_JOBS says otherwise
+DEFAULT_JOBS = 8
+
+
+class LineWriter:
+    """
+    Wraps stdout or stderr so that the scrapers' lines don't get mixed up:
+    print() writes the text and the newline separately, and another thread
+    can print in between.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def write(self, text):
+        pending = getattr(self.local, "pending", "") + text
+        complete, newline, self.local.pending = pending.rpartition("\n")
+        if newline:
+            with self.lock:
+                self.stream.write(complete + newline)
+                self.stream.flush()
+        return len(text)
+
+    def flush(self):
+        pending, self.local.pending = getattr(self.local, "pending", ""), ""
+        if pending:
+            with self.lock:
+                self.stream.write(pending)
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def festivals():
+    """Every directory in src/ that has a scrape.py, like fantasia-2025"""
+    src = os.path.join(PROJECT_ROOT, "src")
+    return sorted(
+        name for name in os.listdir(src)
+        if os.path.exists(os.path.join(src, name, "scrape.py"))
+    )
+
+
+# What run_scraper says about a scraper that raised
+FAILED = "failed"
+
+
+def run_scraper(festival):
+    """
+    Run one festival's scraper, returns (festival, seconds, status, error):
+    status is showlib.FRESH, showlib.STALE (fetching failed and the last good
+    shows.json was kept) or FAILED.
+    """
+    start = time.monotonic()
+    try:
+        # A real module name (not __main__) so that ParsePool's worker
+        # processes can import the scraper's parse functions
+        module = importlib.import_module(f"src.{festival}.scrape")
+        status = module.main()
+    except (Exception, SystemExit) as e:
+        # in one go, so that it isn't mixed up with the other scrapers' output
+        print(f"{festival}: failed\n{traceback.format_exc()}", file=sys.stderr, end="")
+        return festival, time.monotonic() - start, FAILED, e
+    return festival, time.monotonic() - start, status, None
+
+
+def report(results, wall):
+    lines = []
+    for festival, seconds, status, error in sorted(results, key=lambda result: -result[1]):
+        if status == FAILED:
+            status = f"FAILED ({type(error).__name__})"
+        elif status == showlib.STALE:
+            status = "STALE (kept the last good shows.json)"
+        else:
+            status = "ok"
+        lines.append(f"{festival:30} {seconds:7.1f}s  {status}")
+    total = sum(result[1] for result in results)
+    lines.append(f"{'wall time':30} {wall:7.1f}s  ({total:.1f}s one after another)")
+    # Only what was parsed in this process, not in ParsePool's workers. It's
+    # a total: the scrapers run at the same time, so it can't be split up.
+    dates = showlib.DATETIME_STATS
+    lines.append(f"dates parsed: {dates['iso']} ISO, {dates['format']} with a declared "
+                 f"format, {dates['dateutil']} by dateutil (slow, see parse_datetime)")
+    return "\n".join(lines)
+
+
+def exit_status(results):
+    """1 if a scraper failed, 2 if some kept stale shows, otherwise 0"""
+    statuses = {status for _, _, status, _ in results}
+    if FAILED in statuses:
+        return 1
+    if showlib.STALE in statuses:
+        return 2
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the festival scrapers concurrently")
+    parser.add_argument("festival", nargs="*",
+                        help="festival directories in src/ (default: all of them)")
+    parser.add_argument("--jobs", type=int,
+                        default=int(os.environ.get("SCRAPE_JOBS", DEFAULT_JOBS)),
+                        help=f"how many scrapers to run at once (default: $SCRAPE_JOBS "
+                             f"or {DEFAULT_JOBS})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fetch what changed, for scrapers that support it")
+    args = parser.parse_args()
+    if args.incremental:
+        os.environ["SCRAPE_INCREMENTAL"] = "1"
+
+    sys.stdout = LineWriter(sys.stdout)
+    sys.stderr = LineWriter(sys.stderr)
+    names = args.festival or festivals()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max(args.jobs, 1), thread_name_prefix="scrape") as executor:
+        results = list(executor.map(run_scraper, names))
+    print(report(results, time.monotonic() - start))
+    sys.exit(exit_status(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,25 @@
 from pathlib import Path
 
-from bs4 import BeautifulSoup
-from dateutil import parser
+from bs4 import SoupStrainer
 
 from src.cache import HTTPCache
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
+HOSTS = ["www.repercussiontheatre.com"]
+
+# The tour dates are in the text modules, only those get parsed
+TEXT_REGION = SoupStrainer("div", class_="et_pb_text_inner")
+
+# "July 24, 7pm, 2025" or "July 24, 7:30pm, 2025"
+DATE_FORMATS = ["%B %d, %I%p, %Y", "%B %d, %I:%M%p, %Y"]
+
 
 def scrape_shakespeare_data():
     cache = HTTPCache()
     url = "https://www.repercussiontheatre.com/summer-tour-2025/"
     content = cache.fetch(url, timeout=10)
-    soup = BeautifulSoup(content, "html.parser")
+    soup = showlib.soup(content, parse_only=TEXT_REGION)
     showtimes = list(parse_showtimes(soup))
 
     return [
@@ -43,7 +50,7 @@ def parse_showtime(soup):
     # Parse the date string (e.g., "July 24, 7pm")
     h3_text = h3.get_text().strip()
     date_str = f"{h3_text}, 2025"
-    dt = parser.parse(date_str)
+    dt = showlib.parse_datetime(date_str, formats=DATE_FORMATS)
 
     park = venue_parts[0]
     city = venue_parts[1] if len(venue_parts) >= 2 else ""
@@ -65,9 +72,8 @@ def parse_showtimes(soup):
 
 
 def main():
-    shows = scrape_shakespeare_data()
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "Shakespeare")
+    return showlib.scrape(scrape_shakespeare_data, shows_file, "Shakespeare")
 
 
 if __name__ == "__main__":
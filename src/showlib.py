@@ -2,9 +2,87 @@
 Module for managing show collections and saving to JSON
 """
 
+import functools
+import hashlib
 import json
-from datetime import datetime
+import multiprocessing
+import os
+import pickle
+import sys
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
 from typing import List, Dict, Any
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+from dateutil import parser as dateutil_parser
+
+from src.cache import CachedHTTPError, HTTPCache, Request, canonical_json
+
+# Incremental syncs ask for everything modified since the last sync minus
+# this, so that time zones and clock skew don't make us miss changes
+SYNC_OVERLAP = timedelta(days=1)
+
+# Below this many pages, starting worker processes costs more than it saves
+PARSE_POOL_MIN = 8
+
+# What scrape() returns: whether it saved new shows or kept the last good ones
+FRESH = "fresh"
+STALE = "stale"
+
+# How parse_datetime parsed the strings it hasn't seen before: "iso",
+# "format" or "dateutil"
+DATETIME_STATS = Counter()
+
+
+def soup_parser():
+    """
+    The tree builder soup() uses: html.parser, or $SOUP_PARSER. lxml is a lot
+    faster, but it repairs broken markup differently, so run
+    scripts/check_parsers.py before switching a scraper over.
+    """
+    return os.environ.get("SOUP_PARSER") or "html.parser"
+
+
+def soup(markup, **kwargs):
+    """
+    Parse HTML with soup_parser(). Scrapers pass a SoupStrainer for the
+    parts of the page they use as `parse_only`, so that the navigation,
+    scripts and footers never get turned into a tree.
+    """
+    return BeautifulSoup(markup, soup_parser(), **kwargs)
+
+
+def parse_datetime(text, formats=()):
+    """
+    Parse a date and time. ISO 8601 goes through datetime.fromisoformat,
+    then the strptime `formats` the scraper declares are tried, and only
+    if none of those fit do we ask dateutil, which parses almost anything
+    but is slow. Results are memoized since the same strings come up a lot.
+    """
+    return _parse_datetime(text.strip(), tuple(formats))
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_datetime(text, formats):
+    try:
+        result = datetime.fromisoformat(text)
+        DATETIME_STATS["iso"] += 1
+        return result
+    except ValueError:
+        pass
+    for format in formats:
+        try:
+            result = datetime.strptime(text, format)
+            DATETIME_STATS["format"] += 1
+            return result
+        except ValueError:
+            pass
+    result = dateutil_parser.parse(text)
+    DATETIME_STATS["dateutil"] += 1
+    return result
 
 
 class Showtime:
@@ -26,6 +104,15 @@ class Showtime:
             result.update(self.extra)
         return result
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Showtime":
+        extra = {key: value for key, value in data.items() if key not in ("datetime", "venue")}
+        return cls(
+            parse_datetime(data["datetime"]),
+            data.get("venue", ""),
+            extra or None,
+        )
+
     def __repr__(self):
         from pprint import pformat
         return pformat(vars(self))
@@ -60,6 +147,295 @@ class Show:
             result.update(self.extra)
         return result
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Show":
+        extra = {
+            key: value for key, value in data.items() if key not in ("title", "showtimes", "link")
+        }
+        return cls(
+            title=data["title"],
+            link=data["link"],
+            showtimes=[Showtime.from_dict(showtime) for showtime in data["showtimes"]],
+            extra=extra,
+        )
+
+    def update(self, fields: Dict[str, Any]):
+        """Set title/link/showtimes, and anything else goes in extra"""
+        for key, value in fields.items():
+            if key in ("title", "link", "showtimes"):
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+
+def load(filename) -> List[Show]:
+    with open(filename, encoding="utf-8") as f:
+        return [Show.from_dict(show) for show in json.load(f)]
+
+
+def merge(shows, changed, key=lambda show: show.link):
+    """
+    Replace the shows that have the same key as a changed show, and add the
+    new ones at the end
+    """
+    changed_by_key = {}
+    for show in changed:
+        changed_by_key.setdefault(key(show), []).append(show)
+    merged = []
+    for show in shows:
+        k = key(show)
+        if k not in changed_by_key:
+            merged.append(show)
+        elif changed_by_key[k] is not None:
+            merged.extend(changed_by_key[k])
+            changed_by_key[k] = None
+    for new_shows in changed_by_key.values():
+        if new_shows is not None:
+            merged.extend(new_shows)
+    return merged
+
+
+def content_digest(content):
+    """sha256 of a page (bytes or str) or of an API item (canonical JSON)"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    elif not isinstance(content, bytes):
+        content = canonical_json(content)
+    return hashlib.sha256(content).hexdigest()
+
+
+def dump_result(result):
+    if isinstance(result, Show):
+        return json.dumps({"show": result.to_dict()})
+    if isinstance(result, list) and result and all(isinstance(show, Show) for show in result):
+        return json.dumps({"shows": [show.to_dict() for show in result]})
+    return json.dumps({"value": result})
+
+
+def load_result(text):
+    data = json.loads(text)
+    if "show" in data:
+        return Show.from_dict(data["show"])
+    if "shows" in data:
+        return [Show.from_dict(show) for show in data["shows"]]
+    return data["value"]
+
+
+# Not memoized yet
+MISSING = object()
+
+
+def memoize(name, version):
+    """
+    Decorator for a parse function that takes one page (or one API item) and
+    returns a Show, a list of Shows or plain JSON data. Results are kept in
+    cache.db by content hash, so unchanged pages aren't parsed again.
+
+    Bump `version` whenever the parser's output changes. $PARSE_CACHE=0
+    turns memoization off, which is handy while working on a parser.
+    """
+    def decorator(parse):
+        state = {}
+
+        def cache():
+            if "cache" not in state:
+                state["cache"] = HTTPCache()
+                state["cache"].drop_parsed(parser_id(), version)
+            return state["cache"]
+
+        def parser_id():
+            # Different HTML parsers can give slightly different results
+            return f"{name}/{soup_parser()}"
+
+        def lookup(content):
+            """(digest, the memoized result or MISSING)"""
+            if os.environ.get("PARSE_CACHE", "") == "0":
+                return None, MISSING
+            digest = content_digest(content)
+            found = cache().parsed(parser_id(), version, [digest])
+            if digest in found:
+                return digest, load_result(found[digest])
+            return digest, MISSING
+
+        def remember(digest, result):
+            if digest is None:
+                return result
+            text = dump_result(result)
+            cache().put_parsed(parser_id(), version, digest, text)
+            # so that a miss returns exactly what a hit would
+            return load_result(text)
+
+        @functools.wraps(parse)
+        def memoized(content):
+            digest, result = lookup(content)
+            if result is MISSING:
+                result = remember(digest, parse(content))
+            return result
+
+        # For ParsePool, which parses in other processes but looks up and
+        # stores results in this one
+        memoized.lookup = lookup
+        memoized.remember = remember
+        memoized.uncached = parse
+        return memoized
+
+    return decorator
+
+
+def _parse_uncached(parse, content):
+    # Runs in a ParsePool worker: memoized results are handled by the parent
+    return getattr(parse, "uncached", parse)(content)
+
+
+def worker_context():
+    """The multiprocessing context ParsePool starts its workers with"""
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()  # spawn, on Windows
+    context = multiprocessing.get_context("forkserver")
+    # so that workers don't each import bs4 and friends
+    context.set_forkserver_preload(["src.showlib"])
+    return context
+
+
+class ParsePool:
+    """
+    Runs a parse function on many pages in worker processes, since parsing
+    is CPU bound and threads would just take turns holding the GIL.
+
+    Memoized parsers are looked up in cache.db in this process, and only
+    the misses are sent to the workers. Falls back to threads if `parse`
+    can't be pickled, and parses inline when there are fewer than
+    PARSE_POOL_MIN pages or $PARSE_PROCESSES is 0 or 1.
+
+    Workers are started by a forkserver where there is one: forking this
+    process, which has the cache's writer and fetch threads running, could
+    deadlock the child.
+    """
+
+    def __init__(self, parse, pages):
+        self.parse = parse
+        self.executor = None
+        processes = int(os.environ.get("PARSE_PROCESSES", os.cpu_count() or 1))
+        if processes > 1 and pages >= PARSE_POOL_MIN:
+            try:
+                pickle.dumps(parse)
+            except Exception:
+                self.executor = ThreadPoolExecutor(processes)
+            else:
+                self.executor = ProcessPoolExecutor(processes, mp_context=worker_context())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    def submit(self, content):
+        """Start parsing a page, returns a function that returns the result (or raises)"""
+        lookup = getattr(self.parse, "lookup", None)
+        digest = None
+        if lookup is not None:
+            digest, result = lookup(content)
+            if result is not MISSING:
+                return lambda: result
+
+        if self.executor is not None:
+            future = self.executor.submit(_parse_uncached, self.parse, content)
+        else:
+            future = Future()
+            try:
+                future.set_result(_parse_uncached(self.parse, content))
+            except Exception as e:
+                future.set_exception(e)
+
+        remember = getattr(self.parse, "remember", None)
+
+        def result():
+            value = future.result()
+            return remember(digest, value) if remember is not None else value
+
+        return result
+
+
+def failed(e):
+    def result():
+        raise e
+    return result
+
+
+def enrich(cache, shows, extract, headers=None, timeout=10, ttl=None):
+    """
+    Fetch every show's detail page concurrently (within the cache's host
+    limits) and update the show with what `extract(page_text)` returns, like
+    {"description": ..., "image": ...}. A relative image URL is resolved
+    against the page's URL.
+
+    Pages are parsed in a ParsePool as they arrive, while the others are
+    still being fetched.
+
+    A page that's gone (404/410) or that fails to parse is reported and its
+    show is left as it was, so one broken page doesn't lose the whole
+    festival. Any other fetch error (site down, circuit open, out of time)
+    is raised, so that scrape() keeps the last good shows.json instead of
+    saving shows without their details. Returns `shows`, in the same order.
+    """
+    requests_ = [Request(show.link, headers=headers) for show in shows]
+    pages = cache.fetch_many(requests_, timeout=timeout, ttl=ttl, return_exceptions=True)
+    with ParsePool(extract, len(shows)) as pool:
+        results = []
+        for _, page in pages:
+            if isinstance(page, CachedHTTPError):
+                results.append(failed(page))
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                results.append(pool.submit(page.text))
+        for show, request, result in zip(shows, requests_, results):
+            try:
+                fields = result()
+            except Exception as e:
+                print(f"{show.link}: couldn't get the details ({type(e).__name__}: {e})")
+                continue
+            if fields.get("image"):
+                fields["image"] = urljoin(request.url, fields["image"])
+            show.update(fields)
+    return shows
+
+
+class DatePlan:
+    """
+    How to scrape a festival that has one page (or API call) per day: for
+    each day from `start` to `end` inclusive, `request(day)` returns a URL
+    or a Request, and `parse(response, day)` returns that day's shows.
+
+    `run` fetches every day at once through the cache and parses the
+    responses as they come in, in day order.
+    """
+
+    def __init__(self, start: date, end: date, request, parse):
+        self.start = start
+        self.end = end
+        self.request = request
+        self.parse = parse
+
+    def days(self) -> List[date]:
+        return [self.start + timedelta(days=i) for i in range((self.end - self.start).days + 1)]
+
+    def run(self, cache, timeout=10, ttl=None) -> List[Show]:
+        days = self.days()
+        responses = cache.fetch_many([self.request(day) for day in days], timeout=timeout, ttl=ttl)
+        shows = []
+        for day, (_, response) in zip(days, responses):
+            shows.extend(self.parse(response, day))
+        return shows
+
+
+def incremental_requested():
+    return "--incremental" in sys.argv[1:] or os.environ.get("SCRAPE_INCREMENTAL", "") not in ("", "0")
+
 
 def save(shows, filename, festival_name=None):
     with open(filename, "w", encoding="utf-8") as f:
@@ -73,3 +449,49 @@ def save(shows, filename, festival_name=None):
 
     if festival_name:
         print(f"{festival_name}: scraped {len(shows)} events")
+
+
+def scrape(get_shows, filename, festival_name=None, get_changes=None, key=lambda show: show.link):
+    """
+    Run a scraper and save its shows. If fetching fails (site down, circuit
+    open, out of time), keep the last good shows.json instead. Returns
+    FRESH or STALE to say which happened.
+
+    Scrapers that can ask their source for what changed pass `get_changes`,
+    which takes a datetime and returns the shows modified since then. With
+    --incremental (or $SCRAPE_INCREMENTAL=1) only those are fetched and
+    merged into the existing shows.json by `key`. If some of the existing
+    shows have no key (None), it does a full scrape instead.
+    """
+    cache = HTTPCache()
+    name = festival_name or str(filename)
+    started = datetime.now(timezone.utc)
+    since = cache.sync_mark(name)
+    incremental = (
+        get_changes is not None and since is not None and os.path.exists(filename)
+        and incremental_requested()
+    )
+    if incremental:
+        old_shows = load(filename)
+        if any(key(show) is None for show in old_shows):
+            # saved before the scraper recorded what `key` needs
+            print(f"{name}: {filename} has shows without a merge key, doing a full scrape")
+            incremental = False
+    try:
+        if incremental:
+            changed = get_changes(since - SYNC_OVERLAP)
+            shows = merge(old_shows, changed, key)
+        else:
+            shows = get_shows()
+    except requests.RequestException as e:
+        if not os.path.exists(filename):
+            raise
+        print(f"{name}: fetching failed ({e}), keeping the last good {filename}")
+        return STALE
+    if incremental:
+        print(f"{name}: {len(changed)} events changed since {since:%Y-%m-%d %H:%M}")
+    save(shows, filename, festival_name)
+    cache.set_sync_mark(name, started)
+    # so that lost cache writes fail the scrape instead of going unnoticed
+    cache.flush()
+    return FRESH
@@ -1,19 +1,23 @@
 from pathlib import Path
 
-from bs4 import BeautifulSoup
-from dateutil import parser
+from bs4 import SoupStrainer
 
 from src.cache import HTTPCache
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
+HOSTS = ["montreal.ca"]
+
+# Only the event links get parsed
+EVENTS_REGION = SoupStrainer(class_="list-group-item-action")
+
 
 def scrape_theatre_de_verdure_data():
     cache = HTTPCache()
 
     url = "https://montreal.ca/calendrier?dc_relation.url=/lieux/theatre-de-verdure&shownResults=25"
     content = cache.fetch(url, timeout=10)
-    soup = BeautifulSoup(content, "html.parser")
+    soup = showlib.soup(content, parse_only=EVENTS_REGION)
     events = parse_events(soup)
 
     return events
@@ -25,7 +29,7 @@ def parse_event(soup):
 
     # date and time
     datetime_str = soup.select_one("time").get("datetime")
-    dt = parser.parse(datetime_str)
+    dt = showlib.parse_datetime(datetime_str)
 
     showtime = Showtime(dt)
 
@@ -50,9 +54,8 @@ def parse_events(soup):
 
 
 def main():
-    shows = scrape_theatre_de_verdure_data()
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "Theatre de Verdure")
+    return showlib.scrape(scrape_theatre_de_verdure_data, shows_file, "Theatre de Verdure")
 
 
 if __name__ == "__main__":
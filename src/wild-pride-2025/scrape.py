@@ -4,38 +4,37 @@ Fetch Wild Pride program data from the website and convert to fringe format
 
 import re
 from datetime import datetime, timedelta
+import sys
+import time
 from pathlib import Path
 from urllib.parse import urljoin
-from concurrent.futures import ThreadPoolExecutor
 
-from bs4 import BeautifulSoup
+
+from bs4 import SoupStrainer
 
 from src.cache import HTTPCache
 import src.showlib as showlib
 from src.showlib import Show, Showtime
 
-def get_shows():
-    cache = HTTPCache()
-    shows = []
+HOSTS = ["wildpride.ca"]
 
-    url = "https://wildpride.ca"
-    content = cache.fetch(url, timeout=10)
-    content = content.encode('latin-1').decode('utf-8')
-    soup = BeautifulSoup(content, "html.parser")
+LISTING_URL = "https://wildpride.ca"
 
-    events_div = soup.find("div", class_="bcontent")
-    event_elements = events_div.find_all(recursive=False)
+LISTING_REGION = SoupStrainer("div", class_="bcontent")
+DETAILS_REGION = SoupStrainer(class_=["flex-event", "poster"])
 
-    for i in range(0, len(event_elements), 2):
-        if i + 1 >= len(event_elements):
-            break
+# How many detail pages to fetch at the same time
+DETAIL_WORKERS = 16
 
-        h3 = event_elements[i]
-        div = event_elements[i + 1]
+def get_shows():
+    cache = HTTPCache(pool_size=DETAIL_WORKERS)
+    shows = []
 
-        if h3.name != 'h3' or div.name != 'div':
-            continue
+    url = LISTING_URL
+    content = cache.fetch(url, timeout=10)
+    soup = showlib.soup(content, parse_only=LISTING_REGION)
 
+    for h3, div in listing_events(soup):
         link_elem = h3.find('a')
         title_text = h3.get_text()
 
@@ -49,8 +48,7 @@ def get_shows():
                 organizer += sibling.strip()
         organizer = re.sub(r'^\s*by\s+', '', organizer)
 
-        details = div.get_text().strip().split('\n')
-        date_text, location, audience, price = [d.strip() for d in details]
+        date_text, location, audience, price = event_details(div)
 
         showtimes = parse_dates(date_text, location)
         if showtimes:
@@ -69,26 +67,44 @@ def get_shows():
             )
             shows.append(show)
 
-    with ThreadPoolExecutor(max_workers=16) as executor:
-        shows = list(executor.map(lambda s: fetch_description(cache, s), shows))
+    return showlib.enrich(cache, shows, parse_details)
+
+def listing_events(soup):
+    """The (h3, div) pairs for each event on the listing page"""
+    events_div = soup.find("div", class_="bcontent")
+    event_elements = events_div.find_all(recursive=False)
+
+    for i in range(0, len(event_elements), 2):
+        if i + 1 >= len(event_elements):
+            break
+
+        h3 = event_elements[i]
+        div = event_elements[i + 1]
+
+        if h3.name != 'h3' or div.name != 'div':
+            continue
+        yield h3, div
 
-    return shows
+def event_details(div):
+    """date text, location, audience, price"""
+    details = div.get_text().strip().split('\n')
+    return [d.strip() for d in details]
 
-def fetch_description(cache, show):
-    content = cache.fetch(show.link, timeout=10)
-    content = content.encode('latin-1').decode('utf-8')
-    soup = BeautifulSoup(content, "html.parser")
+@showlib.memoize("wild-pride", version=1)
+def parse_details(content):
+    soup = showlib.soup(content, parse_only=DETAILS_REGION)
+    details = {}
 
     event = soup.find(class_="flex-event")
     if event:
         event.find(class_="cal-event-highlights").extract()
-        show.extra['description'] = event.get_text().strip()
+        details['description'] = event.get_text().strip()
 
     poster = soup.find(class_="poster")
     if poster:
-        show.extra['image'] = urljoin(show.link, poster.find("img")["src"])
+        details['image'] = poster.find("img")["src"]
 
-    return show
+    return details
 
 def parse_time(time_str):
     if time_str == 'midnight':
@@ -102,6 +118,135 @@ def parse_time(time_str):
         minute = int(time_match.group(2)) if time_match.group(2) else 0
         return hour, minute
 
+def format_time(hour, minute):
+    return f"{hour:02d}:{minute:02d}"
+
+MONTHS = {
+    'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6,
+    'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12
+}
+
+# A date text is made of numbers and times ("15", "17h30", "9:45h"), words
+# and parentheses
+DATE_TOKENS = re.compile(r"\d[\d:h]*|[A-Za-z]+|[()]")
+
+WORD_KINDS = {
+    **{month: 'month' for month in MONTHS},
+    'midnight': 'time',
+    '(': '(', ')': ')',
+    'show': 'show', 'starts': 'starts', 'at': 'at', 'from': 'from', 'to': 'to',
+}
+
+# When there are several times, the one we want is the first of the best
+# kind, in this order
+SHOW_STARTS, PAREN_STARTS, SHOW_AT, TO_MIDNIGHT, FROM_RANGE, RANGE, AT, AFTER_DAY = range(8)
+
+class DateSegment:
+    """A month, its days ("1,8, and 15" or "1, August 8, and August 15") and their times"""
+
+    def __init__(self, month):
+        self.month = month
+        self.days = []
+        self.has_time = False
+        self.best = None  # (kind of time, start, end)
+        self.paren_start = None
+        self.from_range_end = None
+
+    def candidate(self, kind, start, end=None):
+        if self.best is None or kind < self.best[0]:
+            self.best = (kind, start, end)
+
+    def times(self):
+        """(start, end or None), or None if there's no time"""
+        # "from 17h30 to 21h (concert starts at 19h)"
+        if self.paren_start and self.from_range_end:
+            return self.paren_start, self.from_range_end
+        if self.best is None:
+            return None
+        return self.best[1:]
+
+# Dates and times are in a panoply of inconsistent formats, what a disaster!
+def parse_dates(date_text, venue):
+    if 'register to find out time' in date_text.lower() or 'tba' in date_text.lower():
+        return []
+
+    showtimes = []
+    for segment in date_segments(date_text):
+        times = segment.times()
+        if times is None:
+            continue
+        start_time, end_time = times
+        hour, minute = parse_time(start_time)
+        extra = None
+        if end_time:
+            end_hour, end_minute = parse_time(end_time)
+            extra = {'end_time': format_time(end_hour, end_minute)}
+        for day in segment.days:
+            dt = datetime(2025, segment.month, day, hour, minute)
+            showtimes.append(Showtime(dt, venue, dict(extra) if extra else None))
+
+    return showtimes
+
+def date_segments(date_text):
+    """
+    Split a date text into DateSegments in one left-to-right pass over its
+    tokens. A month after a time starts a new segment.
+    """
+    segments = []
+    segment = None
+    in_paren = False
+    # the last three tokens' kinds, and the last two values
+    kind1 = kind2 = kind3 = None
+    value1 = value2 = None
+    for value in DATE_TOKENS.findall(date_text):
+        if value[0].isdigit():
+            kind = 'time' if 'h' in value else 'day' if value.isdigit() else 'word'
+        else:
+            kind = WORD_KINDS.get(value, 'word')
+            if kind == '(' or kind == ')':
+                in_paren = kind == '('
+
+        if kind == 'month':
+            if segment is None or segment.has_time:
+                segment = DateSegment(MONTHS[value])
+                segments.append(segment)
+        elif segment is None:
+            pass
+        elif kind == 'day':
+            if not segment.has_time:
+                segment.days.append(int(value))
+        elif kind == 'time':
+            segment.has_time = True
+            if kind1 == 'to' and kind2 == 'time':
+                # value2 to value
+                if value == 'midnight':
+                    segment.candidate(TO_MIDNIGHT, value2, value)
+                if kind3 == 'from':
+                    segment.candidate(FROM_RANGE, value2, value)
+                    if segment.from_range_end is None:
+                        segment.from_range_end = value
+                segment.candidate(RANGE, value2, value)
+            if value != 'midnight':
+                if kind1 == 'at' and kind2 == 'starts':
+                    if kind3 == 'show':
+                        segment.candidate(SHOW_STARTS, value)
+                    if in_paren:
+                        segment.candidate(PAREN_STARTS, value)
+                        if segment.paren_start is None:
+                            segment.paren_start = value
+                if kind1 == 'at' and kind2 == 'show':
+                    segment.candidate(SHOW_AT, value)
+                if kind1 == 'at':
+                    segment.candidate(AT, value)
+                if kind1 == 'day' and kind2 == 'month':
+                    segment.candidate(AFTER_DAY, value)
+        elif kind in ('at', 'from'):
+            segment.has_time = True
+
+        kind1, kind2, kind3 = kind, kind1, kind2
+        value1, value2 = value, value1
+    return segments
+
 def extract_days(date_part):
     # Handle patterns like "1,8, and 15" or "1, August 8, and August 15"
     tokens = re.split(r',\s*(?:and\s+)?|\s+and\s+', date_part)
@@ -113,11 +258,9 @@ def extract_days(date_part):
             days.append(int(day_str))
     return days
 
-def format_time(hour, minute):
-    return f"{hour:02d}:{minute:02d}"
-
-# Dates and times are in a panoply of inconsistent formats, what a disaster!
-def parse_dates(date_text, venue):
+# The regex-by-regex parse_dates we used to have, to check the tokenizer
+# against and to time it against
+def reference_parse_dates(date_text, venue):
     if 'register to find out time' in date_text.lower() or 'tba' in date_text.lower():
         return []
 
@@ -194,8 +337,7 @@ def parse_dates(date_text, venue):
 
     return showtimes
 
-def test_parse_dates():
-    test_cases = [
+TEST_CASES = [
         ("July 30 at 17h30", "My venue", [
             Showtime(datetime(2025, 7, 30, 17, 30), "My venue")
         ]),
@@ -245,24 +387,77 @@ def test_parse_dates():
         ("August 16, 20h to midnight", "My venue", [
             Showtime(datetime(2025, 8, 16, 20), "My venue", {'end_time': "00:00"}),
         ]),
+        ("August 2 and 9 at 9:45h", "My venue", [
+            Showtime(datetime(2025, 8, 2, 9, 45), "My venue"),
+            Showtime(datetime(2025, 8, 9, 9, 45), "My venue"),
+        ]),
+        ("August 5, 19h", "My venue", [
+            Showtime(datetime(2025, 8, 5, 19), "My venue"),
+        ]),
     ]
 
-    for i, (date_text, venue, expected) in enumerate(test_cases):
+# Where reference_parse_dates is wrong and parse_dates isn't: it only gave
+# the first day for an "H:MMh" time, and no time after a comma
+REFERENCE_DIFFERS = {
+    "August 2 and 9 at 9:45h",
+    "August 5, 19h",
+}
+
+
+def test_parse_dates():
+    failed = 0
+    for i, (date_text, venue, expected) in enumerate(TEST_CASES):
         result = parse_dates(date_text, venue)
-        if result != expected:
+        reference = reference_parse_dates(date_text, venue)
+        if date_text in REFERENCE_DIFFERS:
+            reference = expected
+        if result != expected or reference != expected:
+            failed += 1
             print(f"Test {i+1}: FAIL")
             print(f"  Input: {date_text}")
             print(f"  Expected: {expected}")
             print(f"  Got: {result}")
+            print(f"  Reference: {reference}")
+    print(f"{len(TEST_CASES) - failed}/{len(TEST_CASES)} date tests pass")
+    return failed == 0
+
+def listing_date_texts():
+    """The date texts from the listing page, from the cache if it's there"""
+    content = HTTPCache().fetch(LISTING_URL, timeout=10)
+    soup = showlib.soup(content, parse_only=LISTING_REGION)
+    return [event_details(div)[0] for _, div in listing_events(soup)]
+
+def benchmark_parse_dates(date_texts, rounds=200):
+    mismatches = [text for text in date_texts if text not in REFERENCE_DIFFERS
+                  and parse_dates(text, "") != reference_parse_dates(text, "")]
+    for text in mismatches:
+        print(f"  differs from the reference: {text!r}")
+
+    timings = {}
+    for parse in (reference_parse_dates, parse_dates):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in date_texts:
+                parse(text, "")
+        timings[parse.__name__] = (time.perf_counter() - start) / rounds
+    reference, tokenizer = timings["reference_parse_dates"], timings["parse_dates"]
+    print(f"{len(date_texts)} date texts: reference {reference * 1000:.2f}ms, "
+          f"tokenizer {tokenizer * 1000:.2f}ms ({reference / tokenizer:.1f}x faster)")
 
 def main():
-    shows = get_shows()
     shows_file = Path(__file__).parent / "shows.json"
-    showlib.save(shows, shows_file, "Wild Pride")
+    return showlib.scrape(get_shows, shows_file, "Wild Pride")
 
 
 if __name__ == "__main__":
-    if len(__import__('sys').argv) > 1 and __import__('sys').argv[1] == 'test':
-        test_parse_dates()
+    if sys.argv[1:] == ['test']:
+        ok = test_parse_dates()
+        try:
+            date_texts = listing_date_texts()
+        except Exception as e:
+            print(f"couldn't get the listing ({e}), timing the test cases instead")
+            date_texts = [date_text for date_text, _, _ in TEST_CASES]
+        benchmark_parse_dates(date_texts)
+        sys.exit(0 if ok else 1)
     else:
         main()
\ No newline at end of file